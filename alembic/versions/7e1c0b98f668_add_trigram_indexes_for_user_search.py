@@ -0,0 +1,41 @@
+"""Add trigram indexes for user search
+
+Revision ID: 7e1c0b98f668
+Revises: 6b9f27425422
+Create Date: 2026-10-15 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7e1c0b98f668'
+down_revision: Union[str, Sequence[str], None] = '6b9f27425422'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # GIN-индексы pg_trgm позволяют ILIKE '%...%' в find_users идти по индексу, а не seq scan.
+    # CONCURRENTLY не блокирует запись в users, но не может выполняться внутри транзакции.
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_username_trgm "
+            "ON users USING gin (username gin_trgm_ops)"
+        )
+        # Выражение должно совпадать с (User.first_name + ' ' + User.last_name) в find_users
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_full_name_trgm "
+            "ON users USING gin ((first_name || ' ' || last_name) gin_trgm_ops)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_users_full_name_trgm")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_users_username_trgm")
@@ -10,4 +10,37 @@ class UserListCallback(CallbackData, prefix="users_list"):
     bot_blocked: Optional[bool] = None
     # ---------------------------
     
-    page: int = 1
\ No newline at end of file
+    page: int = 1
+
+
+# Действия с карточкой пользователя (user_id - ID в нашей БД).
+# Карточки с этими кнопками остаются в истории админ-чата, поэтому
+# формат "user_block_confirm:<id>" и т.п. сохранен как есть.
+class UserBlockConfirmCallback(CallbackData, prefix="user_block_confirm"):
+    user_id: int
+
+
+class UserBlockExecuteCallback(CallbackData, prefix="user_block_execute"):
+    user_id: int
+
+
+class UserUnblockConfirmCallback(CallbackData, prefix="user_unblock_confirm"):
+    user_id: int
+
+
+class UserUnblockExecuteCallback(CallbackData, prefix="user_unblock_execute"):
+    user_id: int
+
+
+class UserActionCancelCallback(CallbackData, prefix="user_action_cancel"):
+    user_id: int
+
+
+# Эти кнопки живут в истории админ-чата (уведомления о заказах и сообщениях),
+# поэтому формат "reply_to:<tg_id>" / "request_contact:<tg_id>" сохранен как есть.
+class ReplyToCallback(CallbackData, prefix="reply_to"):
+    telegram_id: int
+
+
+class RequestContactCallback(CallbackData, prefix="request_contact"):
+    telegram_id: int
@@ -1,13 +1,36 @@
 # app/bot/core.py
+import orjson
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.client.default import DefaultBotProperties # <-- Импортируем новый класс
 from aiogram.enums import ParseMode
 from app.core.config import settings
+from app.bot.middlewares.retry_after import RetryAfterMiddleware
 
 # Создаем объект с настройками по умолчанию
 default_properties = DefaultBotProperties(parse_mode=ParseMode.HTML)
 
+
+def _orjson_dumps(obj) -> str:
+    return orjson.dumps(obj).decode()
+
+
+def create_bot_session() -> AiohttpSession:
+    """
+    HTTP-сессия для Bot API: JSON через orjson (быстрее stdlib json на массовых отправках),
+    пул до 100 соединений. Все запросы при 429 ждут retry_after и повторяются.
+    """
+    session_options = {}
+    if settings.TELEGRAM_API_SERVER_URL:
+        # Собственный Bot API сервер: ближе к приложению, без TLS до api.telegram.org
+        session_options["api"] = TelegramAPIServer.from_base(settings.TELEGRAM_API_SERVER_URL)
+    session = AiohttpSession(json_loads=orjson.loads, json_dumps=_orjson_dumps, limit=100, **session_options)
+    session.middleware(RetryAfterMiddleware())
+    return session
+
+
 # Передаем его в Bot через аргумент `default`
-bot = Bot(token=settings.TELEGRAM_BOT_TOKEN, default=default_properties)
+bot = Bot(token=settings.TELEGRAM_BOT_TOKEN, default=default_properties, session=create_bot_session())
 
 dp = Dispatcher()
\ No newline at end of file
@@ -6,28 +6,36 @@ from fastapi import BackgroundTasks
 from sqlalchemy import Column, String
 from app.bot.filters.admin import IsAdminFilter
 from app.clients.woocommerce import wc_client
-from app.core.redis import redis_client
-from app.db.session import SessionLocal
+from app.core.redis import invalidate_many
+from app.services import settings as settings_service
 from app.models.broadcast import Broadcast
-from app.bot.services.broadcast import process_broadcast
+from app.bot.services.broadcast import enqueue_broadcast
 import asyncio
+from functools import lru_cache
 from app.dependencies import get_db_context # <-- Новый импорт!
 from aiogram.exceptions import TelegramBadRequest
-from app.bot.callbacks.admin import UserListCallback
+from app.bot.callbacks.admin import (
+    UserListCallback,
+    UserBlockConfirmCallback, UserBlockExecuteCallback,
+    UserUnblockConfirmCallback, UserUnblockExecuteCallback,
+    UserActionCancelCallback,
+)
 from app.bot.services.admin_panel import generate_user_list_message
 from aiogram.fsm.context import FSMContext
 from app.crud import user as crud_user
+from app.core import locales
 from app.bot.services import admin_panel as admin_panel_service
-from aiogram.types import CallbackQuery
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup
 from aiogram import F
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from app.dependencies import get_db
-from app.models.user import User
 
+import html
 import logging
 
 logger = logging.getLogger(__name__)
 
+BROADCAST_LEVELS = frozenset({"bronze", "silver", "gold", "all"})
+
 admin_actions_router = Router()
 admin_actions_router.message.filter(IsAdminFilter()) # Защищаем все команды в этом файле
 
@@ -39,12 +47,13 @@ async def set_welcome_bonus(message: Message):
              /promo_welcome on
              /promo_welcome off
     """
-    args = message.text.split()
-    if len(args) < 2:
+    # Берем только первое слово после команды (разделитель - любой пробельный символ)
+    args = message.text.split(maxsplit=2)
+    value = args[1].lower() if len(args) > 1 else ""
+    if not value:
         await message.answer("Пожалуйста, укажите значение. Например: `/promo_welcome 300` или `/promo_welcome on`")
         return
 
-    value = args[1].lower()
     payload = {}
 
     if value.isdigit():
@@ -60,8 +69,8 @@ async def set_welcome_bonus(message: Message):
     try:
         # Отправляем запрос на наш новый эндпоинт в WP
         await wc_client.async_client.post("headless-api/v1/settings", json=payload)
-        # Принудительно сбрасываем кеш настроек в Redis
-        await redis_client.delete("shop_settings")
+        # Принудительно сбрасываем кеш настроек в Redis (и оповещаем воркеры)
+        await invalidate_many([settings_service.SHOP_SETTINGS_CACHE_KEY])
         await message.answer(f"✅ Настройки акции обновлены: `{list(payload.keys())[0]}` = `{list(payload.values())[0]}`")
     except Exception as e:
         await message.answer(f"❌ Ошибка при обновлении настроек: {e}")
@@ -77,13 +86,16 @@ async def create_broadcast_from_reply(message: Message):
         await message.answer("❗️Пожалуйста, используйте эту команду как ответ на сообщение, которое вы хотите разослать.")
         return
         
-    args = message.text.split()
-    target_level = "all"
-    if len(args) > 1 and args[1].lower() in ["bronze", "silver", "gold", "all"]:
-        target_level = args[1].lower()
+    # Уровень - первое слово после команды; без него рассылка идет всем
+    args = message.text.split(maxsplit=2)
+    target_level = args[1].lower() if len(args) > 1 else "all"
+    if target_level not in BROADCAST_LEVELS:
+        # Опечатка в уровне не должна превращаться в рассылку всем пользователям
+        await message.answer(
+            f"❗️Неизвестная группа '{html.escape(target_level)}'. Доступно: {', '.join(sorted(BROADCAST_LEVELS))}."
+        )
+        return
 
-    # --- ИЗМЕНЕНИЕ ЛОГИКИ: СОЗДАЕМ ЗАДАЧУ В БД В ОТДЕЛЬНОЙ ФУНКЦИИ ---
-    
     original_msg = message.reply_to_message
     broadcast_text = ""
     photo_file_id = None
@@ -97,66 +109,67 @@ async def create_broadcast_from_reply(message: Message):
         await message.answer("❗️Для рассылки поддерживается только текст или фото с подписью.")
         return
 
-    # Вызываем синхронную функцию для работы с БД
-    broadcast_id = create_broadcast_in_db(
-        message_text=broadcast_text,
-        target_level=target_level,
-        photo_file_id=photo_file_id
-    )
+    broadcast_id = None
+    try:
+        async with get_db_context() as db:
+            new_broadcast = Broadcast(
+                message_text=broadcast_text,
+                target_level=target_level,
+                photo_file_id=photo_file_id
+            )
+            db.add(new_broadcast)
+            await db.flush() # id приходит через RETURNING, без отдельного SELECT
+            broadcast_id = new_broadcast.id
+            await db.commit()
+    except Exception as e:
+        logger.error(f"Error creating broadcast in DB: {e}")
+        broadcast_id = None
     
     if broadcast_id:
-        # Запускаем фоновую задачу
-        asyncio.create_task(process_broadcast(broadcast_id=broadcast_id))
+        # Ставим в очередь: рассылку выполнит фоновый воркер
+        await enqueue_broadcast(broadcast_id)
         await message.answer(f"✅ Рассылка запущена для группы '{target_level}'.\nID задачи: {broadcast_id}")
     else:
         await message.answer("❌ Не удалось создать задачу на рассылку.")
 
-# --- НОВАЯ СИНХРОННАЯ ФУНКЦИЯ ДЛЯ РАБОТЫ С БД ---
-def create_broadcast_in_db(message_text: str, target_level: str, photo_file_id: str | None) -> int | None:
-    """Создает запись о рассылке в БД в изолированной сессии."""
-    db = SessionLocal()
-    try:
-        # Вам нужно добавить поле photo_file_id в модель Broadcast и сделать миграцию
-        new_broadcast = Broadcast(
-            message_text=message_text,
-            target_level=target_level,
-            photo_file_id=photo_file_id
-        )
-        db.add(new_broadcast)
-        db.commit()
-        db.refresh(new_broadcast)
-        return new_broadcast.id
-    except Exception as e:
-        logger.error(f"Error creating broadcast in DB: {e}")
-        db.rollback()
-        return None
-    finally:
-        db.close()
-
 
 @admin_actions_router.message(Command("stats"))
 async def get_stats_handler(message: Message):
     """Выводит общую статистику по пользователям."""
-    with get_db_context() as db:
-        try:
-            total_users = crud_user.count_all_users(db)
-            bronze_count = crud_user.count_users_by_level(db, "bronze")
-            silver_count = crud_user.count_users_by_level(db, "silver")
-            gold_count = crud_user.count_users_by_level(db, "gold")
-            blocked_bot_count = crud_user.count_users_with_bot_blocked(db)
-            
-            stats_text = (
-                f"📊 <b>Статистика по пользователям:</b>\n\n"
-                f"👥 <b>Всего пользователей:</b> {total_users}\n\n"
-                f"<b>По уровням:</b>\n"
-                f"🥉 Бронза: {bronze_count}\n"
-                f"🥈 Серебро: {silver_count}\n"
-                f"🥇 Золото: {gold_count}\n\n"
-                f"🤖 <b>Заблокировали бота:</b> {blocked_bot_count}"
-            )
-            await message.answer(stats_text)
-        finally:
-            db.close()
+    async with get_db_context() as db:
+        stats = await admin_panel_service.get_user_stats(db)
+
+    stats_text = (
+        f"📊 <b>Статистика по пользователям:</b>\n\n"
+        f"👥 <b>Всего пользователей:</b> {stats['total']}\n\n"
+        f"<b>По уровням:</b>\n"
+        f"🥉 Бронза: {stats['bronze']}\n"
+        f"🥈 Серебро: {stats['silver']}\n"
+        f"🥇 Золото: {stats['gold']}\n\n"
+        f"🤖 <b>Заблокировали бота:</b> {stats['blocked']}"
+    )
+    await message.answer(stats_text)
+
+
+async def _find_wc_telegram_ids(query: str) -> list[int] | None:
+    """
+    Ищет покупателей в WooCommerce и извлекает их telegram_id из email'ов (наш хак).
+    Email'ы с нечисловым префиксом пропускаются. Возвращает None при ошибке запроса.
+    """
+    try:
+        # API WC ищет по частичному совпадению в имени, фамилии, email
+        wc_users_response = await wc_client.get("wc/v3/customers", params={"search": query})
+        wc_users_data = wc_users_response.json()
+    except Exception as e:
+        logger.error(f"Error searching users in WooCommerce: {e}", exc_info=True)
+        return None
+
+    telegram_ids = []
+    for wc_user in wc_users_data:
+        prefix, _, domain = (wc_user.get('email') or '').partition('@')
+        if domain == 'telegram.user' and prefix.isdigit():
+            telegram_ids.append(int(prefix))
+    return telegram_ids
 
 
 @admin_actions_router.message(Command("find_user"))
@@ -180,32 +193,25 @@ async def find_user_handler(message: Message):
 
     await message.answer(f"🔍 Идет поиск по запросу: '{query}'...")
 
-    users = []
-    with get_db_context() as db:
-        # 2. Сначала ищем в нашей быстрой локальной БД
-        users = crud_user.find_users(db, query, limit=10)
-        
-        # 3. Если ничего не нашли и запрос не похож на ID/username, ищем в WooCommerce
-        if not users and not query.isdigit() and not query.startswith('@'):
-            try:
-                # API WC ищет по частичному совпадению в имени, фамилии, email
-                logger.info(f"No users found in local DB for '{query}'. Searching in WooCommerce...")
-                wc_users_response = await wc_client.get("wc/v3/customers", params={"search": query})
-                wc_users_data = wc_users_response.json()
-                
-                if wc_users_data:
-                    # Извлекаем telegram_id из email'ов (наш хак)
-                    telegram_ids = [
-                        int(u['email'].split('@')[0]) 
-                        for u in wc_users_data 
-                        if u.get('email') and '@telegram.user' in u['email']
-                    ]
-                    if telegram_ids:
-                        # Находим этих пользователей в нашей БД по списку ID
-                        users = db.query(User).filter(User.telegram_id.in_(telegram_ids)).limit(10).all()
-            except Exception as e:
-                logger.error(f"Error searching users in WooCommerce: {e}", exc_info=True)
-                await message.answer("Произошла ошибка при поиске в WooCommerce.")
+    # 2. Ищем в локальной БД; запрос по ФИО параллельно ищем и в WooCommerce
+    search_in_wc = not query.isdigit() and not query.startswith('@')
+
+    async with get_db_context() as db:
+        if search_in_wc:
+            users, wc_telegram_ids = await asyncio.gather(
+                crud_user.find_users_async(db, query, limit=10),
+                _find_wc_telegram_ids(query),
+            )
+        else:
+            users = await crud_user.find_users_async(db, query, limit=10)
+            wc_telegram_ids = []
+
+        # 3. Если локально ничего не нашли, берем пользователей, найденных в WooCommerce
+        if not users and wc_telegram_ids:
+            users = await crud_user.get_users_by_telegram_ids_async(db, wc_telegram_ids, limit=10)
+
+    if not users and wc_telegram_ids is None:
+        await message.answer("Произошла ошибка при поиске в WooCommerce.")
 
     # 4. Выводим результаты
     if not users:
@@ -221,196 +227,172 @@ async def find_user_handler(message: Message):
         await message.answer(f"✅ Найдено пользователей: {len(users)}")
         for user in users:
             try:
-                card_text, builder = await admin_panel_service.format_user_card(user)
-                await message.answer(card_text, reply_markup=builder.as_markup())
+                card_text, markup = await admin_panel_service.get_user_card_cached(user)
+                await message.answer(card_text, reply_markup=markup)
             except Exception as e:
                 logger.error(f"Error formatting user card for user {user.id}", exc_info=True)
                 await message.answer(f"Не удалось сформировать карточку для пользователя ID {user.id}.")
 
 # --- Хендлеры для блокировки с подтверждением ---
 
-@admin_actions_router.callback_query(F.data.startswith("user_block_confirm:"))
-async def confirm_block_user(callback: CallbackQuery):
-    """Шаг 1: Запрашивает подтверждение на блокировку."""
-    try:
-        user_id = int(callback.data.split(":")[1])
-    except (ValueError, IndexError):
-        await callback.answer("Ошибка: неверный ID пользователя.", show_alert=True)
-        return
+# Текст кнопки подтверждения и callback, выполняющий действие
+CONFIRM_BUTTONS = {
+    "block": ("🔥 Да, заблокировать", UserBlockExecuteCallback),
+    "unblock": ("✅ Да, разблокировать", UserUnblockExecuteCallback),
+}
 
+@lru_cache(maxsize=1024)
+def _confirm_keyboard(action: str, user_id: int) -> InlineKeyboardMarkup:
+    """Клавиатура "Да / Отмена" для подтверждения действия (неизменяемая, поэтому кешируется)."""
     builder = InlineKeyboardBuilder()
-    builder.button(text="🔥 Да, заблокировать", callback_data=f"user_block_execute:{user_id}")
-    builder.button(text="Отмена", callback_data=f"user_action_cancel:{user_id}")
-    
+    confirm_text, execute_callback = CONFIRM_BUTTONS[action]
+    builder.button(text=confirm_text, callback_data=execute_callback(user_id=user_id).pack())
+    builder.button(text="Отмена", callback_data=UserActionCancelCallback(user_id=user_id).pack())
+    return builder.as_markup()
+
+@admin_actions_router.callback_query(UserBlockConfirmCallback.filter())
+async def confirm_block_user(callback: CallbackQuery, callback_data: UserBlockConfirmCallback):
+    """Шаг 1: Запрашивает подтверждение на блокировку."""
+    user_id = callback_data.user_id
+
     await callback.message.edit_text(
         f"Вы уверены, что хотите <b>заблокировать</b> пользователя с ID <code>{user_id}</code>?",
-        reply_markup=builder.as_markup()
+        reply_markup=_confirm_keyboard("block", user_id)
     )
     await callback.answer()
 
-@admin_actions_router.callback_query(F.data.startswith("user_block_execute:"))
-async def execute_block_user(callback: CallbackQuery):
+@admin_actions_router.callback_query(UserBlockExecuteCallback.filter())
+async def execute_block_user(callback: CallbackQuery, callback_data: UserBlockExecuteCallback):
     """Шаг 2: Выполняет блокировку."""
-    try:
-        user_id = int(callback.data.split(":")[1])
-    except (ValueError, IndexError):
-        await callback.answer("Ошибка: неверный ID пользователя.", show_alert=True)
-        return
-
-    with get_db_context() as db:
+    user_id = callback_data.user_id
+
+    async with get_db_context() as db:
+        user = await crud_user.get_user_by_id_async(db, user_id)
+        if user:
+            user.is_blocked = True
+            await db.commit()
+            await admin_panel_service.invalidate_user_card(user.id)
+
+    if user:
+        # Обновляем карточку пользователя, чтобы показать новый статус
+        card_text, markup = await admin_panel_service.get_user_card_cached(user)
         try:
-            user = crud_user.get_user_by_id(db, user_id)
-            if user:
-                user.is_blocked = True
-                db.commit()
-                db.refresh(user)
-                # Обновляем карточку пользователя, чтобы показать новый статус
-                card_text, builder = await admin_panel_service.format_user_card(user)
-                try:
-                    await callback.message.edit_text(card_text, reply_markup=builder.as_markup())
-                except TelegramBadRequest as e:
-                    # Игнорируем ошибку "message is not modified", но логируем остальные
-                    if "message is not modified" not in str(e):
-                        logger.error(f"Error editing message: {e}")
-                # -------------------------
-                
-                await callback.answer("✅ Пользователь заблокирован.", show_alert=True)
-            else:
-                await callback.message.edit_text("Пользователь не найден.")
-                await callback.answer("❌ Пользователь не найден.", show_alert=True)
-        finally:
-            db.close()
+            await callback.message.edit_text(card_text, reply_markup=markup)
+        except TelegramBadRequest as e:
+            # Игнорируем ошибку "message is not modified", но логируем остальные
+            if "message is not modified" not in str(e):
+                logger.error(f"Error editing message: {e}")
+        # -------------------------
+        
+        await callback.answer("✅ Пользователь заблокирован.", show_alert=True)
+    else:
+        await callback.message.edit_text(locales.ERROR_USER_NOT_FOUND)
+        await callback.answer(locales.ERROR_USER_NOT_FOUND_ALERT, show_alert=True)
 
 # --- ХЕНДЛЕРЫ ДЛЯ ПРОЦЕССА РАЗБЛОКИРОВКИ ---
 
-@admin_actions_router.callback_query(F.data.startswith("user_unblock_confirm:"))
-async def confirm_unblock_user(callback: CallbackQuery):
+@admin_actions_router.callback_query(UserUnblockConfirmCallback.filter())
+async def confirm_unblock_user(callback: CallbackQuery, callback_data: UserUnblockConfirmCallback):
     """Шаг 1: Запрашивает подтверждение на разблокировку (аналогично)."""
-    try:
-        user_id = int(callback.data.split(":")[1])
-    except (ValueError, IndexError):
-        await callback.answer("Ошибка: неверный ID пользователя.", show_alert=True)
-        return
-        
-    builder = InlineKeyboardBuilder()
-    builder.button(text="✅ Да, разблокировать", callback_data=f"user_unblock_execute:{user_id}")
-    builder.button(text="Отмена", callback_data=f"user_action_cancel:{user_id}")
+    user_id = callback_data.user_id
+
     await callback.message.edit_text(
         f"Вы уверены, что хотите <b>разблокировать</b> пользователя с ID <code>{user_id}</code>?",
-        reply_markup=builder.as_markup()
+        reply_markup=_confirm_keyboard("unblock", user_id)
     )
     await callback.answer()
 
-@admin_actions_router.callback_query(F.data.startswith("user_unblock_execute:"))
-async def execute_unblock_user(callback: CallbackQuery):
+@admin_actions_router.callback_query(UserUnblockExecuteCallback.filter())
+async def execute_unblock_user(callback: CallbackQuery, callback_data: UserUnblockExecuteCallback):
     """Шаг 2: Выполняет разблокировку."""
-    try:
-        user_id = int(callback.data.split(":")[1])
-    except (ValueError, IndexError):
-        await callback.answer("Ошибка: неверный ID пользователя.", show_alert=True)
-        return
-
-    with get_db_context() as db:
-        try:
-            user = crud_user.get_user_by_id(db, user_id)
-            if user:
-                user.is_blocked = False
-                db.commit()
-                db.refresh(user)
-                card_text, builder = await admin_panel_service.format_user_card(user)
-                await callback.message.edit_text(card_text, reply_markup=builder.as_markup())
-                await callback.answer("✅ Пользователь разблокирован.", show_alert=True)
-            else:
-                await callback.message.edit_text("Пользователь не найден.")
-                await callback.answer("❌ Пользователь не найден.", show_alert=True)
-        finally:
-            db.close()
+    user_id = callback_data.user_id
+
+    async with get_db_context() as db:
+        user = await crud_user.get_user_by_id_async(db, user_id)
+        if user:
+            user.is_blocked = False
+            await db.commit()
+            await admin_panel_service.invalidate_user_card(user.id)
+
+    if user:
+        card_text, markup = await admin_panel_service.get_user_card_cached(user)
+        await callback.message.edit_text(card_text, reply_markup=markup)
+        await callback.answer("✅ Пользователь разблокирован.", show_alert=True)
+    else:
+        await callback.message.edit_text(locales.ERROR_USER_NOT_FOUND)
+        await callback.answer(locales.ERROR_USER_NOT_FOUND_ALERT, show_alert=True)
 
 # --- ХЕНДЛЕР ДЛЯ ОТМЕНЫ ДЕЙСТВИЯ ---
 
-@admin_actions_router.callback_query(F.data.startswith("user_action_cancel:"))
-async def cancel_user_action(callback: CallbackQuery):
+@admin_actions_router.callback_query(UserActionCancelCallback.filter())
+async def cancel_user_action(callback: CallbackQuery, callback_data: UserActionCancelCallback):
     """Отменяет действие и возвращает исходную карточку пользователя."""
-    try:
-        user_id = int(callback.data.split(":")[1])
-    except (ValueError, IndexError):
-        await callback.answer("Ошибка: неверный ID пользователя.", show_alert=True)
-        return
+    user_id = callback_data.user_id
 
-    with get_db_context() as db:
-        try:
-            user = crud_user.get_user_by_id(db, user_id)
-            if user:
-                card_text, builder = await admin_panel_service.format_user_card(user)
-                await callback.message.edit_text(card_text, reply_markup=builder.as_markup())
-                await callback.answer("Действие отменено.")
-            else:
-                await callback.message.edit_text("Пользователь не найден.")
-        finally:
-            db.close()
+    async with get_db_context() as db:
+        user = await crud_user.get_user_by_id_async(db, user_id)
+
+    if user:
+        card_text, markup = await admin_panel_service.get_user_card_cached(user)
+        await callback.message.edit_text(card_text, reply_markup=markup)
+        await callback.answer("Действие отменено.")
+    else:
+        await callback.message.edit_text(locales.ERROR_USER_NOT_FOUND)
 
 
 @admin_actions_router.message(Command("users"))
 async def list_users_handler(message: Message):
     """Показывает первую страницу списка пользователей."""
-    with get_db_context() as db:
-        try:
-            text, markup = await generate_user_list_message(db)
-            await message.answer(text, reply_markup=markup)
-        finally:
-            db.close()
+    text, markup = await generate_user_list_message()
+    await message.answer(text, reply_markup=markup)
 
 @admin_actions_router.callback_query(UserListCallback.filter(F.action == "nav"))
 async def navigate_user_list_handler(callback: CallbackQuery, callback_data: UserListCallback):
     """Обрабатывает навигацию по страницам."""
-    with get_db_context() as db:
+    try:
+        text, markup = await generate_user_list_message(
+            page=callback_data.page, 
+            level=callback_data.level, 
+            bot_blocked=callback_data.bot_blocked
+        )
+        
+        # --- ИСПРАВЛЕНИЕ ЗДЕСЬ ---
         try:
-            text, markup = await generate_user_list_message(
-                db, 
-                page=callback_data.page, 
-                level=callback_data.level, 
-                bot_blocked=callback_data.bot_blocked
-            )
-            
-            # --- ИСПРАВЛЕНИЕ ЗДЕСЬ ---
-            try:
-                await callback.message.edit_text(text, reply_markup=markup)
-            except TelegramBadRequest as e:
-                if "message is not modified" not in str(e):
-                    logger.error(f"Error editing user list message: {e}")
-            # -------------------------
-            
-        except Exception as e:
-            logger.error(f"Error in user list navigation: {e}")
-            await callback.answer("Произошла ошибка.", show_alert=True)
-            
+            await callback.message.edit_text(text, reply_markup=markup)
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                logger.error(f"Error editing user list message: {e}")
+        # -------------------------
+        
+    except Exception as e:
+        logger.error(f"Error in user list navigation: {e}")
+        await callback.answer(locales.ERROR_GENERIC_ALERT, show_alert=True)
+        
     await callback.answer() # Ответ на колбэк, чтобы "часики" исчезли
 
 @admin_actions_router.callback_query(UserListCallback.filter(F.action.in_(["f_level", "f_block"])))
 async def filter_user_list_handler(callback: CallbackQuery, callback_data: UserListCallback):
     """Обрабатывает применение фильтров."""
-    with get_db_context() as db:
+    try:
+        # Просто берем все данные из callback_data
+        text, markup = await generate_user_list_message(
+            page=1, # При смене фильтра всегда сбрасываем на 1-ю страницу
+            level=callback_data.level,
+            bot_blocked=callback_data.bot_blocked
+        )
+
+        # --- ИСПРАВЛЕНИЕ ЗДЕСЬ ---
         try:
-            # Просто берем все данные из callback_data
-            text, markup = await generate_user_list_message(
-                db,
-                page=1, # При смене фильтра всегда сбрасываем на 1-ю страницу
-                level=callback_data.level,
-                bot_blocked=callback_data.bot_blocked
-            )
+            await callback.message.edit_text(text, reply_markup=markup)
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                logger.error(f"Error editing user list message: {e}")
+        # -------------------------
 
-            # --- ИСПРАВЛЕНИЕ ЗДЕСЬ ---
-            try:
-                await callback.message.edit_text(text, reply_markup=markup)
-            except TelegramBadRequest as e:
-                if "message is not modified" not in str(e):
-                    logger.error(f"Error editing user list message: {e}")
-            # -------------------------
-
-        except Exception as e:
-            logger.error(f"Error in user list filtering: {e}")
-            await callback.answer("Произошла ошибка.", show_alert=True)
-            
+    except Exception as e:
+        logger.error(f"Error in user list filtering: {e}")
+        await callback.answer(locales.ERROR_GENERIC_ALERT, show_alert=True)
+        
     await callback.answer()
 
 
@@ -424,32 +406,15 @@ async def filter_user_list_handler(callback: CallbackQuery, callback_data: UserL
 
 
 
-@admin_actions_router.message(F.text, ~Command(commands=["start", "cancel", "help"]))
+@admin_actions_router.message(F.text, F.chat.type == "private", ~Command(commands=["start", "cancel", "help"]))
 async def admin_fallback_handler(message: Message, state: FSMContext):
     """
-    Ловит любые текстовые сообщения от админа, которые не подошли
+    Ловит любые текстовые сообщения от админа в личке, которые не подошли
     под другие админские хендлеры и если админ НЕ в состоянии FSM.
+    Сообщения из групп отсекаются фильтром, без обращения к хранилищу FSM.
     """
     current_state = await state.get_state()
     if current_state is not None:
         return
 
-    if message.chat.type == "private":
-        # --- ИСПРАВЛЕННАЯ РАЗМЕТКА ---
-        help_text = (
-            "🤖 <b>Панель администратора</b>\n\n"
-            "<b>Статистика:</b>\n"
-            "<code>/stats</code> - общая статистика по пользователям\n\n"
-            "<b>Поиск пользователя:</b>\n"
-            "<code>/find_user &lt;ID/TG_ID/username&gt;</code>\n\n"
-            "<b>Управление акциями:</b>\n"
-            "<code>/promo_welcome &lt;сумма&gt;</code>\n"
-            "<code>/promo_welcome on|off</code>\n\n"
-            "<b>Рассылки (в админ-группе):</b>\n"
-            "Ответьте на сообщение командой:\n"
-            "<code>/send_broadcast &lt;all|bronze|silver|gold&gt;</code>"
-        )
-        # ----------------------------
-        await message.answer(help_text, parse_mode="HTML")
-
-
+    await message.answer(locales.ADMIN_HELP_TEXT, parse_mode="HTML")
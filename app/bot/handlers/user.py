@@ -1,50 +1,157 @@
 # app/bot/handlers/user.py
 
+import asyncio
 from aiogram import F, Router
 from aiogram.filters import CommandStart, CommandObject
-from aiogram.types import Message, WebAppInfo, ContentType
-from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
-from sqlalchemy.orm import Session
+from aiogram.types import (
+    Message, WebAppInfo, ContentType,
+    InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup,
+)
+from aiogram.utils.keyboard import InlineKeyboardBuilder
 from app.clients.woocommerce import wc_client
 from app.core.config import settings
-from app.dependencies import get_db, get_db_context
+from app.dependencies import get_db_context
 from app.crud import user as crud_user
 from app.services import auth as auth_service
 from app.bot.core import bot
 from app.bot.filters.admin import IsAdminFilter
+from app.bot.callbacks.admin import ReplyToCallback
 import logging
-from app.services import user as user_service
+from app.bot.services import admin_panel as admin_panel_service
 
 logger = logging.getLogger(__name__)
 # Создаем роутер для этого модуля.
 user_router = Router()
 
+# Статичные клавиатуры одинаковы для всех пользователей - собираем их один раз
+OPEN_SHOP_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🛍️ Открыть магазин", web_app=WebAppInfo(url=settings.MINI_APP_URL))]
+])
+BACK_TO_SHOP_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="⬅️ Вернуться в магазин", web_app=WebAppInfo(url=settings.MINI_APP_URL))]
+])
+SHARE_CONTACT_KEYBOARD = ReplyKeyboardMarkup(
+    keyboard=[[KeyboardButton(text="📞 Поделиться номером", request_contact=True)]],
+    resize_keyboard=True,
+    one_time_keyboard=True
+)
+
+
+# Пачка сообщений, пришедших от пользователя за это окно, пересылается админу одним запросом
+FORWARD_DEBOUNCE_SECONDS = 1.0
+# telegram_id -> сообщения, ожидающие пересылки
+_pending_forwards: dict[int, list[Message]] = {}
+# Шаблоны подписей для админ-чата
+FORWARD_HEADER_TEMPLATE = "<b>Сообщение от клиента:</b> {full_name}{username_part}\n(ID: <code>{telegram_id}</code>)"
+CONTACT_HEADER_TEMPLATE = "<b>От:</b> {full_name}{username_part}"
+FORWARD_ACK_TEXT = "✅ Ваше сообщение передано менеджеру. Мы скоро ответим!"
+# Лимиты Bot API на длину текста и подписи
+MESSAGE_TEXT_LIMIT = 4096
+CAPTION_LIMIT = 1024
+CAPTION_CONTENT_TYPES = frozenset({
+    ContentType.PHOTO, ContentType.VIDEO, ContentType.DOCUMENT,
+    ContentType.AUDIO, ContentType.ANIMATION, ContentType.VOICE,
+})
+# Ссылки на фоновые задачи, чтобы их не собрал GC
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _username_part(message: Message) -> str:
+    """' (@username)' для подписи в админ-чате или пустая строка."""
+    username = message.from_user.username
+    return f" (@{username})" if username else ""
+
+
+def _run_in_background(coro):
+    """Запускает корутину фоновой задачей, не дожидаясь ее завершения."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
 
 async def forward_to_admin(message: Message):
     """
-    Общая логика для пересылки любого сообщения в админ-чат.
+    Ставит сообщение клиента в очередь на пересылку в админ-чат.
+    Серия сообщений ("привет", "у меня вопрос", ...) уходит одной пачкой.
+    """
+    user_id = message.from_user.id
+    pending = _pending_forwards.get(user_id)
+    if pending is not None:
+        pending.append(message)
+        return
+
+    _pending_forwards[user_id] = [message]
+    _run_in_background(_flush_forwards(user_id))
+
+
+async def _relay_with_info(message: Message, user_info: str, markup: InlineKeyboardMarkup) -> bool:
+    """
+    Доставляет одиночное сообщение в админ-чат одним вызовом API: инфо о клиенте
+    и кнопка добавляются к тексту (или подписи медиа). False - если так нельзя
+    (тип без подписи или превышен лимит длины), тогда нужна обычная пересылка.
     """
-    user_info = f"<b>Сообщение от клиента:</b> {message.from_user.full_name}"
-    if message.from_user.username:
-        user_info += f" (@{message.from_user.username})"
-    user_info += f"\n(ID: <code>{message.from_user.id}</code>)"
+    if message.content_type == ContentType.TEXT:
+        text = f"{user_info}\n\n{message.html_text}"
+        if len(text) > MESSAGE_TEXT_LIMIT:
+            return False
+        await bot.send_message(chat_id=settings.ADMIN_CHAT_ID, text=text, reply_markup=markup)
+        return True
+
+    if message.content_type in CAPTION_CONTENT_TYPES:
+        caption = f"{user_info}\n\n{message.html_text}" if message.caption else user_info
+        if len(caption) > CAPTION_LIMIT:
+            return False
+        await bot.copy_message(
+            chat_id=settings.ADMIN_CHAT_ID,
+            from_chat_id=message.chat.id,
+            message_id=message.message_id,
+            caption=caption,
+            reply_markup=markup
+        )
+        return True
+
+    return False
+
+
+async def _flush_forwards(user_id: int):
+    """Пересылает накопленную пачку сообщений: forward_messages + инфо с кнопкой + один ответ клиенту."""
+    await asyncio.sleep(FORWARD_DEBOUNCE_SECONDS)
+    messages = _pending_forwards.pop(user_id)
+    first_message = messages[0]
+
+    user_info = FORWARD_HEADER_TEMPLATE.format_map({
+        "full_name": first_message.from_user.full_name,
+        "username_part": _username_part(first_message),
+        "telegram_id": user_id,
+    })
 
     builder = InlineKeyboardBuilder()
-    builder.button(text="🤖 Ответить", callback_data=f"reply_to:{message.from_user.id}")
+    builder.button(text="🤖 Ответить", callback_data=ReplyToCallback(telegram_id=user_id).pack())
+    markup = builder.as_markup()
 
     try:
-        # Пересылаем оригинальное сообщение
-        await message.forward(chat_id=settings.ADMIN_CHAT_ID)
-        # И следом отправляем инфо с кнопкой
-        await bot.send_message(
+        if len(messages) == 1 and await _relay_with_info(first_message, user_info, markup):
+            await first_message.answer(FORWARD_ACK_TEXT)
+            return
+
+        # Пересылаем оригинальные сообщения одним запросом
+        await bot.forward_messages(
             chat_id=settings.ADMIN_CHAT_ID,
-            text=user_info,
-            reply_markup=builder.as_markup()
+            from_chat_id=first_message.chat.id,
+            message_ids=sorted(m.message_id for m in messages)
+        )
+        # Инфо с кнопкой (после пересылки) и ответ клиенту - параллельно
+        await asyncio.gather(
+            bot.send_message(
+                chat_id=settings.ADMIN_CHAT_ID,
+                text=user_info,
+                reply_markup=markup
+            ),
+            first_message.answer(FORWARD_ACK_TEXT)
         )
-        await message.answer("✅ Ваше сообщение передано менеджеру. Мы скоро ответим!")
     except Exception as e:
         logger.error(f"Failed to forward user message: {e}")
-        await message.answer("Произошла ошибка при отправке вашего сообщения. Пожалуйста, попробуйте позже.")
+        await first_message.answer("Произошла ошибка при отправке вашего сообщения. Пожалуйста, попробуйте позже.")
 
 
 @user_router.message(CommandStart(), ~IsAdminFilter())
@@ -53,47 +160,52 @@ async def command_start_handler(message: Message, command: CommandObject) -> Non
     Обрабатывает команду /start от НЕ-админов,
     регистрирует пользователя и ловит реферальный код.
     """
-    if command.args and command.args.startswith("request_contact_"):
+    args = command.args or ""
+    if args.startswith("request_contact_"):
         # TODO: Можно добавить проверку токена из command.args, если нужна доп. безопасность
         
-        builder = ReplyKeyboardBuilder()
-        builder.button(text="📞 Поделиться номером", request_contact=True)
-        
         await message.answer(
             "Пожалуйста, нажмите кнопку ниже, чтобы поделиться вашим номером телефона.",
-            reply_markup=builder.as_markup(resize_keyboard=True, one_time_keyboard=True)
+            reply_markup=SHARE_CONTACT_KEYBOARD
         )
         # Важно! Завершаем выполнение, чтобы не отправлять основное приветствие
         return
     
     referral_code = None
-    if command.args and command.args.startswith("ref_"):
-        referral_code = command.args.split("ref_")[1]
+    if args.startswith("ref_"):
+        referral_code = args.removeprefix("ref_")
     
-    db: Session = next(get_db())
-    try:
-        db_user = await auth_service.register_or_get_user(
-                db=db, # <-- Передаем db
-                user_info=message.from_user.model_dump(),
+    user_info = message.from_user.model_dump()
+    async with get_db_context() as db:
+        # Существующий пользователь: профиль и статус бота обновляются одним запросом
+        # (строка переписывается, только если данные изменились)
+        activation = await crud_user.activate_user_from_telegram_async(
+            db,
+            telegram_id=message.from_user.id,
+            username=message.from_user.username,
+            first_name=message.from_user.first_name,
+            last_name=message.from_user.last_name
+        )
+        if activation and activation[1]:
+            await db.commit()
+
+    if activation:
+        user_id, changed = activation
+        if changed:
+            await admin_panel_service.invalidate_user_card(user_id)
+    else:
+        # Новый пользователь: регистрация (клиент в WooCommerce, реферал, бонусы) та же, что в API,
+        # но через AsyncSession, чтобы не блокировать цикл событий бота
+        async with get_db_context() as db:
+            await auth_service.register_or_get_user_async(
+                db=db,
+                user_info=user_info,
                 referral_code=referral_code
             )
-        user_service.update_user_profile_from_telegram(db, db_user, message.from_user.model_dump())
-        if not db_user.bot_accessible:
-            logger.info(f"User {db_user.id} re-activated the bot. Setting bot_accessible to True.")
-            db_user.bot_accessible = True
-            db.commit()
-    finally:
-        db.close()
-    
-    builder = InlineKeyboardBuilder()
-    builder.button(
-        text="🛍️ Открыть магазин",
-        web_app=WebAppInfo(url=settings.MINI_APP_URL) 
-    )
     
     await message.answer(
         f"👋 Привет, {message.from_user.full_name}!\n\nДобро пожаловать в наш магазин. Нажмите кнопку ниже, чтобы начать покупки.",
-        reply_markup=builder.as_markup()
+        reply_markup=OPEN_SHOP_KEYBOARD
     )
 
 
@@ -111,38 +223,40 @@ async def handle_contact(message: Message):
         return
 
     # --- НОВАЯ ЛОГИКА СОХРАНЕНИЯ ---
-    with get_db_context() as db:
-        user = crud_user.get_user_by_telegram_id(db, message.from_user.id)
+    async with get_db_context() as db:
+        # 1. Сохраняем в нашу БД
+        user = await crud_user.update_user_phone_by_telegram_id_async(db, message.from_user.id, contact.phone_number)
         if user:
-            # 1. Сохраняем в нашу БД
-            crud_user.update_user_phone(db, user, contact.phone_number)
-            
-            # 2. Асинхронно синхронизируем с WooCommerce
-            try:
-                await wc_client.post(
-                    f"wc/v3/customers/{user.wordpress_id}",
-                    json={"billing": {"phone": contact.phone_number}}
-                )
-                logger.info(f"Successfully synced phone for user {user.id} to WooCommerce.")
-            except Exception as e:
-                logger.error(f"Failed to sync phone for user {user.id} to WooCommerce.", exc_info=True)
+            await db.commit()
         else:
             logger.warning(f"Received contact from user {message.from_user.id}, but user not found in DB.")
 
-    # 3. Отправляем пользователю подтверждение и кнопку для возврата
-    builder = InlineKeyboardBuilder()
-    builder.button(text="⬅️ Вернуться в магазин", web_app=WebAppInfo(url=settings.MINI_APP_URL))
-    
-    await message.answer(
-        "✅ Спасибо, ваш номер телефона сохранен! Можете вернуться к покупкам.",
-        reply_markup=builder.as_markup()
+    if user:
+        await admin_panel_service.invalidate_user_card(user.id)
+        # 2. Синхронизация с WooCommerce - в фоне, ответ пользователю ее не ждет
+        _run_in_background(_sync_phone_to_wc(user.id, user.wordpress_id, contact.phone_number))
+
+    # 3. Подтверждение пользователю и пересылка контакта админу идут параллельно
+    results = await asyncio.gather(
+        message.answer(
+            "✅ Спасибо, ваш номер телефона сохранен! Можете вернуться к покупкам.",
+            reply_markup=BACK_TO_SHOP_KEYBOARD
+        ),
+        _send_contact_to_admin(message),
+        return_exceptions=True
     )
-    # ---------------------------
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Failed to deliver contact of user {message.from_user.id}: {result}")
 
-    # Пересылаем контакт админу (старая логика)
-    user_info = f"<b>От:</b> {message.from_user.full_name}"
-    if message.from_user.username:
-        user_info += f" (@{message.from_user.username})"
+
+async def _send_contact_to_admin(message: Message):
+    """Пересылает контакт в админ-чат (контакт и подпись - строго по порядку)."""
+    contact = message.contact
+    user_info = CONTACT_HEADER_TEMPLATE.format_map({
+        "full_name": message.from_user.full_name,
+        "username_part": _username_part(message),
+    })
     
     await bot.send_contact(
         chat_id=settings.ADMIN_CHAT_ID,
@@ -153,6 +267,18 @@ async def handle_contact(message: Message):
     )
     await bot.send_message(settings.ADMIN_CHAT_ID, user_info)
 
+async def _sync_phone_to_wc(user_id: int, wordpress_id: int, phone: str):
+    """Записывает телефон в billing клиента WooCommerce (фоновая задача)."""
+    try:
+        await wc_client.post(
+            f"wc/v3/customers/{wordpress_id}",
+            json={"billing": {"phone": phone}}
+        )
+        logger.info(f"Successfully synced phone for user {user_id} to WooCommerce.")
+    except Exception as e:
+        logger.error(f"Failed to sync phone for user {user_id} to WooCommerce.", exc_info=True)
+
+
 @user_router.message(~IsAdminFilter())
 async def handle_any_user_message(message: Message):
     """
@@ -0,0 +1,67 @@
+# app/bot/middlewares/retry_after.py
+import asyncio
+import logging
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+
+logger = logging.getLogger(__name__)
+
+
+# Методы Bot API, повтор которых не меняет результат (в отличие от send*, copy*, forward*)
+IDEMPOTENT_METHOD_PREFIXES = ("get", "edit")
+IDEMPOTENT_METHODS = frozenset({"answerCallbackQuery", "sendChatAction"})
+
+
+def _is_idempotent(method: TelegramMethod) -> bool:
+    api_method = method.__api_method__
+    return api_method in IDEMPOTENT_METHODS or api_method.startswith(IDEMPOTENT_METHOD_PREFIXES)
+
+
+class RetryAfterMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: при flood-limit (429) ждет ровно retry_after секунд,
+    которые вернул Telegram, и повторяет запрос, вместо того чтобы отдавать ошибку хендлеру.
+    Слишком долгие паузы не ждем - такой запрос лучше провалить сразу.
+    Сетевые ошибки повторяются с экспоненциальной паузой (1, 2, 4... до 8 секунд),
+    но только для идемпотентных методов - отправки сообщений не дублируем.
+    """
+    def __init__(self, max_retries: int = 2, max_wait_seconds: int = 30, max_network_backoff_seconds: int = 8):
+        self.max_retries = max_retries
+        self.max_wait_seconds = max_wait_seconds
+        self.max_network_backoff_seconds = max_network_backoff_seconds
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        attempt = 0
+        while True:
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                if attempt > self.max_retries or e.retry_after > self.max_wait_seconds:
+                    raise
+                logger.warning(
+                    "Flood limit on %s: retrying in %ss (attempt %s/%s).",
+                    type(method).__name__, e.retry_after, attempt, self.max_retries
+                )
+                await asyncio.sleep(e.retry_after)
+            except TelegramNetworkError as e:
+                attempt += 1
+                # Таймаут мог наступить, когда Telegram уже принял запрос: повтор send*/copy*/forward*
+                # доставил бы сообщение дважды. Поэтому повторяем только идемпотентные методы
+                if attempt > self.max_retries or not _is_idempotent(method):
+                    raise
+                backoff = min(2 ** (attempt - 1), self.max_network_backoff_seconds)
+                logger.warning(
+                    "Network error on %s: %s. Retrying in %ss (attempt %s/%s).",
+                    type(method).__name__, e, backoff, attempt, self.max_retries
+                )
+                await asyncio.sleep(backoff)
@@ -1,27 +1,138 @@
 # app/bot/services/admin_panel.py
+import asyncio
+import json
+import logging
+import time
+from functools import lru_cache
 from typing import Optional
 from app.models.user import User
 from app.clients.woocommerce import wc_client
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from app.bot.utils.user_display import get_display_name
 from app.crud import user as crud_user
-from app.bot.callbacks.admin import UserListCallback
+from app.bot.callbacks.admin import (
+    UserListCallback, UserBlockConfirmCallback, UserUnblockConfirmCallback, ReplyToCallback
+)
 import math
-from sqlalchemy.orm import Session
-from aiogram.types import InlineKeyboardButton # <-- Добавляем импорт
+from sqlalchemy.ext.asyncio import AsyncSession
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from app.crud import user as crud_user
 from app.clients.woocommerce import wc_client
+from app.core.config import settings
+from app.core.redis import redis_client, invalidate_many
+from app.dependencies import get_db_context
+
+logger = logging.getLogger(__name__)
+
+USER_STATS_CACHE_KEY = "stats:users"
+USER_STATS_CACHE_TTL_SECONDS = 60
+USER_CARD_CACHE_KEY = "admin:user_card:{user_id}"
+USER_CARD_CACHE_TTL_SECONDS = 120
+WC_CUSTOMER_CACHE_KEY = "wc:customer:{wordpress_id}"
+WC_CUSTOMER_CACHE_TTL_SECONDS = 600
+WC_CUSTOMER_CACHED_FIELDS = ("first_name", "last_name", "email")
+# Подписи кнопок фильтра по уровню: (обычная, выбранная)
+LEVEL_FILTER_BUTTON_TEXTS = {
+    lvl: (f"🏅 {lvl.capitalize()}", f"✅ {lvl.capitalize()}")
+    for lvl in ("all", "bronze", "silver", "gold")
+}
+
+
+# Второй уровень кеша - в памяти процесса, плюс общий запрос для одновременных вызовов
+WC_CUSTOMER_LOCAL_TTL_SECONDS = 60
+WC_CUSTOMER_LOCAL_MAX_SIZE = 2048
+_wc_customers_local: dict[int, tuple[float, dict[str, str]]] = {}
+_wc_customers_inflight: dict[int, asyncio.Task] = {}
+
+
+async def get_wc_customer_cached(wordpress_id: int) -> dict[str, str]:
+    """
+    Возвращает имя и email клиента из WooCommerce.
+    Сначала смотрит в память процесса (1 мин), затем в Redis (10 мин), затем в WC.
+    Одновременные запросы одного клиента (несколько админов) ждут один общий запрос.
+    Ошибки WooCommerce пробрасываются вызывающему коду.
+    """
+    cached = _wc_customers_local.get(wordpress_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    task = _wc_customers_inflight.get(wordpress_id)
+    if task is None:
+        task = asyncio.create_task(_load_wc_customer(wordpress_id))
+        _wc_customers_inflight[wordpress_id] = task
+        task.add_done_callback(lambda _: _wc_customers_inflight.pop(wordpress_id, None))
+    # shield: отмена одного ожидающего не отменяет общий запрос для остальных
+    customer = await asyncio.shield(task)
+
+    _wc_customers_local.pop(wordpress_id, None)
+    if len(_wc_customers_local) >= WC_CUSTOMER_LOCAL_MAX_SIZE:
+        # Вытесняем самую старую запись (словарь хранит порядок вставки)
+        _wc_customers_local.pop(next(iter(_wc_customers_local)))
+    _wc_customers_local[wordpress_id] = (time.monotonic() + WC_CUSTOMER_LOCAL_TTL_SECONDS, customer)
+    return customer
+
+
+async def _load_wc_customer(wordpress_id: int) -> dict[str, str]:
+    """Читает клиента из Redis-хеша (TTL 10 мин), при промахе - из WooCommerce."""
+    cache_key = WC_CUSTOMER_CACHE_KEY.format(wordpress_id=wordpress_id)
+    try:
+        cached_customer = await redis_client.hgetall(cache_key)
+        if cached_customer:
+            return cached_customer
+    except Exception as e:
+        logger.warning(f"Failed to read WC customer {wordpress_id} from cache: {e}")
+
+    wc_customer_data = (await wc_client.get(f"wc/v3/customers/{wordpress_id}")).json()
+    customer = {field: wc_customer_data.get(field) or "" for field in WC_CUSTOMER_CACHED_FIELDS}
+
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.hset(cache_key, mapping=customer)
+            pipe.expire(cache_key, WC_CUSTOMER_CACHE_TTL_SECONDS)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to cache WC customer {wordpress_id}: {e}")
+    return customer
+
+
+async def get_user_stats(db: AsyncSession) -> dict[str, int]:
+    """
+    Возвращает статистику по пользователям для /stats.
+    Результат кешируется в Redis на минуту; при недоступности Redis идем в БД.
+    """
+    try:
+        cached_stats = await redis_client.get(USER_STATS_CACHE_KEY)
+        if cached_stats:
+            return json.loads(cached_stats)
+    except Exception as e:
+        logger.warning(f"Failed to read user stats from cache: {e}")
+
+    stats = await crud_user.get_user_stats_async(db)
+
+    try:
+        await redis_client.set(USER_STATS_CACHE_KEY, json.dumps(stats), ex=USER_STATS_CACHE_TTL_SECONDS)
+    except Exception as e:
+        logger.warning(f"Failed to cache user stats: {e}")
+    return stats
+
+
+async def invalidate_user_stats():
+    """Сбрасывает кеш статистики (новый пользователь, смена уровня)."""
+    try:
+        await invalidate_many([USER_STATS_CACHE_KEY])
+    except Exception as e:
+        logger.warning(f"Failed to invalidate user stats cache: {e}")
+
 
 async def format_user_card(user: User) -> tuple[str, InlineKeyboardBuilder]:
     """Формирует текст и кнопки для карточки пользователя."""
-    # Получаем доп. инфо из WC
-    wc_user_data = (await wc_client.get(f"wc/v3/customers/{user.wordpress_id}")).json()
+    # Доп. инфо из WC (имя кешируется по wordpress_id) и последние 3 заказа - параллельно
+    wc_user_data, orders_response = await asyncio.gather(
+        get_wc_customer_cached(user.wordpress_id),
+        wc_client.get(f"wc/v3/orders", params={"customer": user.wordpress_id, "per_page": 3})
+    )
     display_name = get_display_name(wc_user_data, user)
-
-    # full_name = f"{wc_user_data.get('first_name', '')} {wc_user_data.get('last_name', '')}".strip()
-    
-    # Получаем последние 3 заказа
-    orders_data = (await wc_client.get(f"wc/v3/orders", params={"customer": user.wordpress_id, "per_page": 3})).json()
+    orders_data = orders_response.json()
     orders_lines = []
     if orders_data:
         for order in orders_data:
@@ -45,40 +156,109 @@ async def format_user_card(user: User) -> tuple[str, InlineKeyboardBuilder]:
     # Формируем кнопки
     builder = InlineKeyboardBuilder()
     builder.button(text="👤 Написать", url=f"tg://user?id={user.telegram_id}")
-    builder.button(text="🤖 Ответить", callback_data=f"reply_to:{user.telegram_id}")
+    builder.button(text="🤖 Ответить", callback_data=ReplyToCallback(telegram_id=user.telegram_id).pack())
     
     if user.is_blocked:
-        builder.button(text="✅ Разблокировать", callback_data=f"user_unblock_confirm:{user.id}")
+        builder.button(text="✅ Разблокировать", callback_data=UserUnblockConfirmCallback(user_id=user.id).pack())
     else:
-        builder.button(text="🚫 Заблокировать", callback_data=f"user_block_confirm:{user.id}")
+        builder.button(text="🚫 Заблокировать", callback_data=UserBlockConfirmCallback(user_id=user.id).pack())
         
     builder.adjust(2)
     return card_text, builder
 
 
+async def get_user_card_cached(user: User) -> tuple[str, InlineKeyboardMarkup]:
+    """
+    Возвращает текст и клавиатуру карточки пользователя, кешируя их в Redis,
+    чтобы переходы "Подтвердить" -> "Отмена" не ходили каждый раз в WooCommerce.
+    """
+    cache_key = USER_CARD_CACHE_KEY.format(user_id=user.id)
+    try:
+        cached_card = await redis_client.get(cache_key)
+        if cached_card:
+            card = json.loads(cached_card)
+            return card["text"], InlineKeyboardMarkup.model_validate(card["markup"])
+    except Exception as e:
+        logger.warning(f"Failed to read user card {user.id} from cache: {e}")
+
+    card_text, builder = await format_user_card(user)
+    markup = builder.as_markup()
+
+    try:
+        card = {"text": card_text, "markup": markup.model_dump(mode="json", exclude_none=True)}
+        await redis_client.set(cache_key, json.dumps(card), ex=USER_CARD_CACHE_TTL_SECONDS)
+    except Exception as e:
+        logger.warning(f"Failed to cache user card {user.id}: {e}")
+    return card_text, markup
+
+
+async def invalidate_user_card(user_id: int):
+    """Сбрасывает закешированную карточку пользователя после изменения его данных."""
+    try:
+        await invalidate_many([USER_CARD_CACHE_KEY.format(user_id=user_id)])
+    except Exception as e:
+        logger.warning(f"Failed to invalidate user card {user_id}: {e}")
+
+
+async def invalidate_user_cards(user_ids: list[int]):
+    """Сбрасывает карточки нескольких пользователей за один round trip (после массовых изменений)."""
+    if not user_ids:
+        return
+    try:
+        await invalidate_many([USER_CARD_CACHE_KEY.format(user_id=user_id) for user_id in user_ids])
+    except Exception as e:
+        logger.warning(f"Failed to invalidate {len(user_ids)} user cards: {e}")
+
+
 USERS_PER_PAGE = 5
 
+
+async def _fetch_wc_customers(wordpress_ids: list[int]) -> dict[int, dict]:
+    """
+    Получает клиентов WooCommerce одним запросом (фильтр include) вместо запроса на каждого.
+    При ошибке возвращает пустой словарь - в списке тогда показываются username/ID.
+    """
+    if not wordpress_ids:
+        return {}
+    try:
+        response = await wc_client.get(
+            "wc/v3/customers",
+            params={"include": ",".join(map(str, wordpress_ids)), "per_page": len(wordpress_ids)}
+        )
+        return {customer["id"]: customer for customer in response.json()}
+    except Exception as e:
+        logger.warning(f"Failed to fetch WC customers for user list: {e}")
+        return {}
+
 async def generate_user_list_message(
-    db: Session,
     page: int = 1,
     level: str | None = None,
     bot_blocked: bool | None = None
 ):
-    """Генерирует текст и клавиатуру для пагинированного списка пользователей."""
+    """
+    Генерирует текст и клавиатуру для пагинированного списка пользователей.
+    Сессия БД открывается только на время запроса страницы: запросы в WooCommerce
+    за именами идут уже без занятого соединения из пула.
+    """
     
     skip = (page - 1) * USERS_PER_PAGE
-    users = crud_user.get_users(db, skip, USERS_PER_PAGE, level, bot_blocked)
-    total_users = crud_user.count_users_with_filters(db, level, bot_blocked)
+    async with get_db_context() as db:
+        users, total_users = await crud_user.list_users_paginated_async(db, skip, USERS_PER_PAGE, level, bot_blocked)
     total_pages = math.ceil(total_users / USERS_PER_PAGE) if total_users > 0 else 1
 
     message_lines = [f"👥 <b>Список пользователей</b> (Стр. {page}/{total_pages})\n"]
     if users:
+        # Username уже дает понятное имя - в WooCommerce идем только за остальными
+        wc_customers = await _fetch_wc_customers([
+            user.wordpress_id for user in users
+            if settings.PREFER_WC_BILLING_NAME or not user.username
+        ])
         for user in users:
-            try:
-                wc_user_data = (await wc_client.get(f"wc/v3/customers/{user.wordpress_id}")).json()
+            if user.username and not settings.PREFER_WC_BILLING_NAME:
+                display_name = user.username
+            else:
+                wc_user_data = wc_customers.get(user.wordpress_id, {})
                 display_name = f"{wc_user_data.get('first_name', '')} {wc_user_data.get('last_name', '')}".strip() or user.username or f"ID {user.telegram_id}"
-            except Exception:
-                display_name = user.username or f"ID {user.telegram_id}"
             
             status_icon = "✅" if user.bot_accessible else "🤖"
             block_icon = "🚫" if user.is_blocked else ""
@@ -86,7 +266,20 @@ async def generate_user_list_message(
     else:
         message_lines.append("<i>Пользователи не найдены.</i>")
 
-    # --- ИСПРАВЛЕННАЯ ЛОГИКА СОЗДАНИЯ КЛАВИАТУРЫ ---
+    return "\n".join(message_lines), _user_list_keyboard(page, total_pages, level, bot_blocked)
+
+
+@lru_cache(maxsize=512)
+def _user_list_keyboard(
+    page: int,
+    total_pages: int,
+    level: str | None,
+    bot_blocked: bool | None
+) -> InlineKeyboardMarkup:
+    """
+    Клавиатура списка пользователей (фильтры + навигация).
+    Зависит только от аргументов, поэтому собирается один раз и переиспользуется.
+    """
     builder = InlineKeyboardBuilder()
     
     # Кнопки навигации
@@ -110,9 +303,8 @@ async def generate_user_list_message(
     
     # Кнопки фильтров по уровню
     filter_buttons_row1 = []
-    levels = ["all", "bronze", "silver", "gold"]
-    for lvl in levels:
-        text = f"🏅 {lvl.capitalize()}" if lvl != level else f"✅ {lvl.capitalize()}"
+    for lvl, (text_default, text_selected) in LEVEL_FILTER_BUTTON_TEXTS.items():
+        text = text_selected if lvl == level else text_default
         filter_buttons_row1.append(
             InlineKeyboardButton(text=text, callback_data=UserListCallback(
                 action="f_level", 
@@ -154,4 +346,4 @@ async def generate_user_list_message(
     if filter_buttons_row1: builder.row(*filter_buttons_row1)
     if nav_buttons or filter_buttons_row2: builder.row(*nav_buttons, *filter_buttons_row2)
 
-    return "\n".join(message_lines), builder.as_markup()
\ No newline at end of file
+    return builder.as_markup()
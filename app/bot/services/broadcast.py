@@ -1,11 +1,17 @@
 # app/bot/services/broadcast.py
 
 import asyncio
-from datetime import datetime
+import contextlib
+import functools
+import time
+from datetime import datetime, timezone
 from sqlalchemy.orm import Session
 from aiogram.exceptions import TelegramForbiddenError
+from sqlalchemy import update
+from redis.exceptions import LockNotOwnedError
 
 from app.db.session import SessionLocal
+from app.core.redis import redis_client
 from app.models.broadcast import Broadcast
 from app.models.user import User
 from app.bot.core import bot
@@ -14,91 +20,270 @@ from app.bot.services import notification as notification_service
 import logging
 
 logger = logging.getLogger(__name__)
-# Пауза между отправкой сообщений, чтобы не превысить лимиты Telegram
-BROADCAST_SLEEP_SECONDS = 0.1 # 10 сообщений в секунду
+# Лимит скорости рассылок: общий с остальными массовыми отправками процесса
+broadcast_limiter = notification_service.telegram_send_limiter
+BROADCAST_BATCH_SIZE = 50 # Сколько отправок выполняется параллельно
+BROADCAST_FETCH_SIZE = 1000 # Сколько получателей читается из БД за один запрос
+
+# Очередь задач на рассылку: строки Broadcast в БД хранят состояние,
+# а в Redis лежат только ID, ожидающие обработки воркером.
+BROADCAST_QUEUE_KEY = "broadcast:queue"
+BROADCAST_QUEUE_POLL_SECONDS = 5
+BROADCAST_WORKER_CONCURRENCY = 2 # Сколько рассылок может идти одновременно
+
+# Рассылки выполняет только один процесс - владелец блокировки в Redis:
+# лимит скорости отправок действует в пределах процесса. Владелец продлевает
+# блокировку каждые HEARTBEAT секунд; если он умер, через TTL ее забирает другой процесс.
+BROADCAST_WORKER_LOCK_KEY = "broadcast:worker_lock"
+BROADCAST_WORKER_LOCK_TTL_SECONDS = 30
+BROADCAST_WORKER_HEARTBEAT_SECONDS = 10
+
+
+async def enqueue_broadcast(broadcast_id: int):
+    """Ставит рассылку в очередь на обработку воркером."""
+    await redis_client.lpush(BROADCAST_QUEUE_KEY, broadcast_id)
+
+
+async def requeue_pending_broadcasts():
+    """
+    Возвращает в очередь рассылки, которые так и не были начаты
+    (например, процесс перезапустился до того, как воркер их забрал).
+    """
+    with SessionLocal() as db:
+        pending_ids = [
+            broadcast_id for (broadcast_id,) in
+            db.query(Broadcast.id).filter(Broadcast.status == "pending").order_by(Broadcast.id).all()
+        ]
+
+    queued_ids = {int(broadcast_id) for broadcast_id in await redis_client.lrange(BROADCAST_QUEUE_KEY, 0, -1)}
+    for broadcast_id in pending_ids:
+        if broadcast_id not in queued_ids:
+            logger.info("Re-queueing pending broadcast %s.", broadcast_id)
+            await enqueue_broadcast(broadcast_id)
+
+
+def fail_interrupted_broadcasts():
+    """
+    Помечает как 'failed' рассылки, оставшиеся в статусе 'processing':
+    вызывается сразу после захвата блокировки воркера, когда прежний владелец
+    уже перестал ее продлевать, то есть его рассылки брошены и сами не завершатся.
+    """
+    with SessionLocal() as db:
+        interrupted_count = db.query(Broadcast).filter(
+            Broadcast.status == "processing"
+        ).update({"status": "failed", "finished_at": datetime.now(timezone.utc)}, synchronize_session=False)
+        db.commit()
+    if interrupted_count:
+        logger.warning("Marked %s interrupted broadcast(s) as failed.", interrupted_count)
+
+
+async def _process_broadcast_slot(broadcast_id: int, semaphore: asyncio.Semaphore):
+    try:
+        await process_broadcast(broadcast_id=broadcast_id)
+    finally:
+        semaphore.release()
+
+
+async def run_broadcast_worker():
+    """
+    Фоновый воркер: забирает ID рассылок из очереди Redis и выполняет их,
+    не более BROADCAST_WORKER_CONCURRENCY одновременно. Пока все слоты заняты,
+    новые задачи остаются в очереди.
+    """
+    semaphore = asyncio.Semaphore(BROADCAST_WORKER_CONCURRENCY)
+    running_tasks: set[asyncio.Task] = set()
+    logger.info("Broadcast worker started.")
+
+    try:
+        await _consume_broadcast_queue(semaphore, running_tasks)
+    finally:
+        # Начатые рассылки останавливаются вместе с воркером (строки остаются в 'processing'
+        # и будут помечены 'failed' следующим владельцем блокировки)
+        for task in list(running_tasks):
+            task.cancel()
+
+
+async def _consume_broadcast_queue(semaphore: asyncio.Semaphore, running_tasks: set[asyncio.Task]):
+    while True:
+        await semaphore.acquire()
+        try:
+            item = await redis_client.brpop(BROADCAST_QUEUE_KEY, timeout=BROADCAST_QUEUE_POLL_SECONDS)
+        except asyncio.CancelledError:
+            semaphore.release()
+            raise
+        except Exception as e:
+            semaphore.release()
+            logger.error("Broadcast worker failed to read the queue: %s", e)
+            await asyncio.sleep(BROADCAST_QUEUE_POLL_SECONDS)
+            continue
+
+        if not item:
+            semaphore.release()
+            continue
+
+        _, broadcast_id = item
+        task = asyncio.create_task(_process_broadcast_slot(int(broadcast_id), semaphore))
+        running_tasks.add(task)
+        task.add_done_callback(running_tasks.discard)
+
+
+async def _hold_broadcast_worker_lock(lock) -> None:
+    """
+    Продлевает блокировку воркера каждые HEARTBEAT секунд.
+    Возвращается, когда блокировка потеряна или ее не удается продлить:
+    владелец сдается раньше, чем истечет TTL, чтобы два процесса не рассылали одновременно.
+    """
+    last_renewed = time.monotonic()
+    while True:
+        await asyncio.sleep(BROADCAST_WORKER_HEARTBEAT_SECONDS)
+        try:
+            await lock.reacquire()
+            last_renewed = time.monotonic()
+        except LockNotOwnedError:
+            logger.error("Broadcast worker lock was taken over by another process.")
+            return
+        except Exception as e:
+            if time.monotonic() - last_renewed >= BROADCAST_WORKER_LOCK_TTL_SECONDS - BROADCAST_WORKER_HEARTBEAT_SECONDS:
+                logger.error("Could not renew broadcast worker lock, giving it up: %s", e)
+                return
+            logger.warning("Failed to renew broadcast worker lock: %s", e)
+
+
+async def run_broadcast_worker_supervisor():
+    """
+    Запускается в каждом процессе (воркеры gunicorn, поллинг). Процесс, захвативший
+    блокировку в Redis, выполняет рассылки, пока ее продлевает; остальные ждут
+    и забирают работу, если владелец остановился или перестал продлевать блокировку.
+    """
+    lock = redis_client.lock(BROADCAST_WORKER_LOCK_KEY, timeout=BROADCAST_WORKER_LOCK_TTL_SECONDS, thread_local=False)
+    while True:
+        try:
+            acquired = await lock.acquire(blocking=False)
+        except Exception as e:
+            logger.error("Failed to acquire broadcast worker lock: %s", e)
+            acquired = False
+        if not acquired:
+            await asyncio.sleep(BROADCAST_WORKER_HEARTBEAT_SECONDS)
+            continue
+
+        logger.info("This process now runs the broadcast worker.")
+        worker_task = None
+        try:
+            fail_interrupted_broadcasts()
+            await requeue_pending_broadcasts()
+            worker_task = asyncio.create_task(run_broadcast_worker())
+            await _hold_broadcast_worker_lock(lock)
+        except Exception as e:
+            logger.error("Broadcast worker supervisor failed: %s", e, exc_info=True)
+        finally:
+            if worker_task:
+                worker_task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await worker_task
+            # Блокировка могла уже истечь или перейти к другому процессу - это не ошибка
+            with contextlib.suppress(Exception):
+                await lock.release()
+        await asyncio.sleep(BROADCAST_WORKER_HEARTBEAT_SECONDS)
+
+
+def _make_broadcast_sender(message_text: str, photo_file_id: str | None):
+    """
+    Выбирает способ отправки один раз на рассылку:
+    фото с подписью или просто текст. Возвращает функцию chat_id -> корутина.
+    """
+    if photo_file_id:
+        return functools.partial(bot.send_photo, photo=photo_file_id, caption=message_text)
+    return functools.partial(bot.send_message, text=message_text)
+
+
+async def _send_broadcast_message(send, telegram_id: int):
+    """Отправляет сообщение рассылки одному пользователю с учетом общего лимита скорости."""
+    async with broadcast_limiter:
+        await send(chat_id=telegram_id)
+
 
 async def process_broadcast(broadcast_id: int):
     """
     Основная функция, выполняющая рассылку.
     Получает пользователей из БД, отправляет им сообщения (текст или фото)
-    и формирует отчет для администратора.
+    пачками параллельно (в пределах лимита скорости) и формирует отчет для администратора.
     """
     db: Session = SessionLocal()
     try:
-        broadcast = db.query(Broadcast).filter(Broadcast.id == broadcast_id).first()
-        if not broadcast or broadcast.status != "pending":
-            logger.info(f"Broadcast {broadcast_id} not found or already processed.")
+        # Атомарно "захватываем" рассылку, чтобы два воркера не запустили ее дважды
+        claimed = db.query(Broadcast).filter(
+            Broadcast.id == broadcast_id, Broadcast.status == "pending"
+        ).update({"status": "processing", "started_at": datetime.now(timezone.utc)}, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            logger.info("Broadcast %s not found or already processed.", broadcast_id)
             return
 
-        logger.info(f"Starting broadcast {broadcast_id}...")
-        broadcast.status = "processing"
-        broadcast.started_at = datetime.utcnow()
-        db.commit()
+        logger.info("Starting broadcast %s...", broadcast_id)
+        broadcast = db.query(Broadcast).filter(Broadcast.id == broadcast_id).first()
+        send = _make_broadcast_sender(broadcast.message_text, broadcast.photo_file_id)
 
-        # 1. Получаем список пользователей для рассылки
-        query = db.query(User).filter(User.is_blocked == False)
+        # 1. Получаем пользователей для рассылки.
+        # Берем только нужные колонки: строки не "протухают" после промежуточных коммитов
+        query = db.query(User.id, User.telegram_id, User.username, User.bot_accessible).filter(User.is_blocked == False)
         if broadcast.target_level and broadcast.target_level != "all":
             query = query.filter(User.level == broadcast.target_level)
-        
-        users_to_send = query.all()
-        
-        # 2. Итерируемся и отправляем сообщения
+
+        # 2. Читаем получателей страницами по ID (keyset) и отправляем сообщения пачками.
+        # В памяти держится только одна страница; серверный курсор не подходит,
+        # так как между пачками делаются коммиты.
         sent_count = 0
         failed_users = []
-        
-        for user in users_to_send:
+        last_user_id = 0
+
+        while True:
+            users_page = query.filter(User.id > last_user_id).order_by(User.id).limit(BROADCAST_FETCH_SIZE).all()
+            if not users_page:
+                break
+            last_user_id = users_page[-1].id
+
             # Проверяем флаг доступности бота перед отправкой
-            if not user.bot_accessible:
-                failed_users.append({"user": user, "reason": "Bot marked as inaccessible"})
-                continue
-                
-            success = False
-            reason = None
-            
-            try:
-                if broadcast.photo_file_id:
-                    # Отправляем фото с подписью
-                    await bot.send_photo(
-                        chat_id=user.telegram_id,
-                        photo=broadcast.photo_file_id,
-                        caption=broadcast.message_text
-                    )
+            recipients = []
+            for user in users_page:
+                if user.bot_accessible:
+                    recipients.append(user)
                 else:
-                    # Отправляем просто текст
-                    await bot.send_message(
-                        chat_id=user.telegram_id,
-                        text=broadcast.message_text
-                    )
-                success = True
-            except TelegramForbiddenError:
-                # Пользователь заблокировал бота
-                reason = "User has blocked the bot"
-                logger.error(f"User {user.id} has blocked the bot. Updating status.")
-                user.bot_accessible = False
-                db.add(user)
-                # Коммитим изменение статуса немедленно
-                db.commit()
-            except Exception as e:
-                # Любая другая ошибка (например, чат не найден)
-                reason = str(e)
-                logger.error(f"Failed to send message to user {user.id}: {reason}")
-
-            if success:
-                sent_count += 1
-            else:
-                failed_users.append({"user": user, "reason": reason})
-            
-            # Делаем паузу
-            await asyncio.sleep(BROADCAST_SLEEP_SECONDS)
+                    failed_users.append({"user": user, "reason": "Bot marked as inaccessible"})
+
+            for start in range(0, len(recipients), BROADCAST_BATCH_SIZE):
+                batch = recipients[start:start + BROADCAST_BATCH_SIZE]
+                results = await asyncio.gather(
+                    *[_send_broadcast_message(send, user.telegram_id) for user in batch],
+                    return_exceptions=True
+                )
+
+                blocked_user_ids = []
+                for user, result in zip(batch, results):
+                    if result is None:
+                        sent_count += 1
+                    elif isinstance(result, TelegramForbiddenError):
+                        # Пользователь заблокировал бота
+                        logger.error("User %s has blocked the bot. Updating status.", user.id)
+                        blocked_user_ids.append(user.id)
+                        failed_users.append({"user": user, "reason": "User has blocked the bot"})
+                    else:
+                        # Любая другая ошибка (например, чат не найден)
+                        logger.error("Failed to send message to user %s: %s", user.id, result)
+                        failed_users.append({"user": user, "reason": str(result)})
+
+                # Статус "бот недоступен" - одним UPDATE на пачку
+                if blocked_user_ids:
+                    db.execute(update(User).where(User.id.in_(blocked_user_ids)).values(bot_accessible=False))
+                    db.commit()
 
         # 3. Обновляем статистику и статус рассылки
         broadcast.status = "completed"
         broadcast.sent_count = sent_count
         broadcast.failed_count = len(failed_users)
-        broadcast.finished_at = datetime.utcnow()
+        broadcast.finished_at = datetime.now(timezone.utc)
         db.commit()
         
-        logger.info(f"Broadcast {broadcast_id} completed. Sent: {sent_count}, Failed: {len(failed_users)}")
+        logger.info("Broadcast %s completed. Sent: %s, Failed: %s", broadcast_id, sent_count, len(failed_users))
 
         # 4. Отправляем отчет админу
         await notification_service.send_broadcast_report_to_admin(
@@ -108,9 +293,9 @@ async def process_broadcast(broadcast_id: int):
         )
 
     except Exception as e:
-        logger.error(f"Broadcast {broadcast_id} failed catastrophically: {e}")
+        logger.error("Broadcast %s failed catastrophically: %s", broadcast_id, e)
         if 'broadcast' in locals() and broadcast:
             broadcast.status = "failed"
             db.commit()
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
@@ -1,154 +1,290 @@
 # app/bot/services/notification.py
 import asyncio
+from typing import Any
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
 from pydantic import HttpUrl
+from sqlalchemy import update
 from sqlalchemy.orm import Session
-from aiogram.exceptions import TelegramForbiddenError
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.ext.asyncio import AsyncSession
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter
+)
 from app.schemas.order import Order
 from app.bot.core import bot
 from app.models.user import User
 from app.crud import user as crud_user # Нам понадобится CRUD для обновления статуса бота
 from app.core.config import settings
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.utils.formatting import Bold, Italic, Text, TextLink, as_list
+from app.bot.callbacks.admin import ReplyToCallback, RequestContactCallback
+from app.bot.services import admin_panel as admin_panel_service
 from app.models.user import User
-from aiogram.utils.keyboard import ReplyKeyboardBuilder # <-- Меняем импорт
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, WebAppInfo
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, WebAppInfo, InlineKeyboardButton, InlineKeyboardMarkup
 import logging
+from aiolimiter import AsyncLimiter
 
 logger = logging.getLogger(__name__)
 
-async def _send_message(db: Session, user: User, text: str) -> tuple[bool, str | None]:
+# Общий лимит скорости отправок пользователям: Telegram допускает ~30 сообщений
+# в секунду на бота. Через него идут все отправки этого модуля и рассылки.
+# Ответы 429 (RetryAfter) дополнительно обрабатывает middleware сессии бота.
+TELEGRAM_SEND_RATE_PER_SECOND = 25
+telegram_send_limiter = AsyncLimiter(TELEGRAM_SEND_RATE_PER_SECOND, 1)
+
+# В один чат Telegram разрешает ~1 сообщение в секунду: несколько уведомлений
+# одному пользователю подряд (статус заказа + начисление баллов) разносим по времени
+CHAT_SEND_RATE_PER_SECOND = 1
+CHAT_LIMITERS_MAX_SIZE = 10000
+_chat_limiters: dict[int, AsyncLimiter] = {}
+
+def _chat_limiter(chat_id: int) -> AsyncLimiter:
+    """Лимитер отдельного чата. Простаивающие лимитеры периодически удаляются."""
+    limiter = _chat_limiters.get(chat_id)
+    if limiter is None:
+        if len(_chat_limiters) >= CHAT_LIMITERS_MAX_SIZE:
+            for idle_chat_id in [cid for cid, lim in _chat_limiters.items() if lim.has_capacity(lim.max_rate)]:
+                del _chat_limiters[idle_chat_id]
+        limiter = _chat_limiters[chat_id] = AsyncLimiter(CHAT_SEND_RATE_PER_SECOND, 1)
+    return limiter
+
+async def _send_to_chat(send, chat_id: int, **kwargs):
     """
-    Приватная функция-обертка для безопасной отправки сообщений.
-    Обновляет статус 'bot_accessible' в случае блокировки.
+    Отправка в произвольный чат (админский, супер-админам) через те же лимиты скорости,
+    что и уведомления пользователям: весь исходящий трафик модуля делит один бюджет.
+    send - метод бота (bot.send_message, bot.send_photo и т.п.).
+    """
+    async with _chat_limiter(chat_id), telegram_send_limiter:
+        return await send(chat_id=chat_id, **kwargs)
+
+# Отдельный пул потоков для записи через синхронную сессию, чтобы не занимать пул по умолчанию
+_db_write_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="notification-db")
+
+async def _run_sync_db(func, *args) -> None:
+    """
+    Выполняет блокирующую операцию синхронной сессии в потоке, не останавливая цикл событий.
+    Пока корутина ждет, сессию никто больше не использует - это безопасно для Session.
+    """
+    await asyncio.get_running_loop().run_in_executor(_db_write_executor, func, *args)
+
+async def _commit(db: Session | AsyncSession) -> None:
+    """
+    Фиксирует изменения в сессии. Функции уведомлений вызываются как из
+    синхронного кода (FastAPI, фоновые задачи), так и из асинхронных хендлеров бота.
+    """
+    if isinstance(db, AsyncSession):
+        await db.commit()
+    else:
+        await _run_sync_db(db.commit)
+
+async def _execute(db: Session | AsyncSession, statement) -> None:
+    """Выполняет запрос в сессии любого типа (см. _commit)."""
+    if isinstance(db, AsyncSession):
+        await db.execute(statement)
+    else:
+        await _run_sync_db(db.execute, statement)
+
+async def _set_bot_accessible(db: Session | AsyncSession, user: User, accessible: bool) -> None:
+    """
+    Сохраняет статус доступности бота для пользователя точечным UPDATE.
+    Запись в БД не блокирует цикл событий: AsyncSession ожидается,
+    синхронная сессия работает в отдельном потоке.
+    """
+    # Меняем значение в объекте, не помечая его "грязным": в БД пишет только UPDATE ниже
+    set_committed_value(user, "bot_accessible", accessible)
+    await _execute(db, update(User).where(User.id == user.id).values(bot_accessible=accessible))
+    await _commit(db)
+    await admin_panel_service.invalidate_user_card(user.id)
+
+BOT_BLOCKED_REASON = "User has blocked the bot"
+
+async def _deliver(db: Session, user: User, send, update_status: bool = True) -> tuple[bool, str | None]:
+    """
+    Единая безопасная отправка пользователю: send - метод бота с уже подставленными
+    аргументами (functools.partial), ему передается только chat_id.
+    Проверяет флаг доступности, соблюдает лимит скорости и обновляет статус
+    'bot_accessible' в случае блокировки
+    (при update_status=False это делает вызывающий код, например одним UPDATE на пачку).
     Возвращает кортеж (успех: bool, причина_неудачи: str | None).
     """
     if not user.bot_accessible:
         reason = "Bot is marked as inaccessible"
-        logger.info(f"Skipping notification for user {user.id}: {reason}.")
+        logger.info("Skipping notification for user %s: %s.", user.id, reason)
         return False, reason
             
     try:
-        await bot.send_message(chat_id=user.telegram_id, text=text)
+        async with _chat_limiter(user.telegram_id), telegram_send_limiter:
+            await send(chat_id=user.telegram_id)
         return True, None # Успех, причины нет
     except TelegramForbiddenError:
-        reason = "User has blocked the bot"
-        logger.error(f"User {user.id} has blocked the bot. Updating status.")
-        user.bot_accessible = False
-        db.add(user)
-        db.commit()
+        reason = BOT_BLOCKED_REASON
+        logger.error("User %s has blocked the bot. Updating status.", user.id)
+        if update_status:
+            await _set_bot_accessible(db, user, False)
+        return False, reason
+    except (TelegramRetryAfter, TelegramNetworkError) as e:
+        # Временная ошибка: повторы уже сделал RetryAfterMiddleware сессии бота.
+        # Статус пользователя не трогаем - в следующий раз отправка, скорее всего, пройдет
+        reason = f"Temporary error: {type(e).__name__}"
+        logger.warning("Temporary failure sending to user %s: %s", user.id, e)
+        return False, reason
+    except TelegramBadRequest as e:
+        # Ошибка в самом запросе (текст, разметка, чат) - повтор не поможет, пользователь доступен
+        reason = str(e)
+        logger.error("Bad request sending to user %s: %s", user.id, reason)
         return False, reason
     except Exception as e:
         reason = str(e) # Любая другая ошибка
-        logger.error(f"Failed to send message to user {user.id}: {reason}")
+        logger.error("Failed to send message to user %s: %s", user.id, reason)
         return False, reason
-    
 
-async def ping_user(db: Session, user: User) -> bool:
+async def _send_message(
+    db: Session, user: User, text: str, update_status: bool = True, **send_options
+) -> tuple[bool, str | None]:
     """
-    Проверяет доступность пользователя, отправляя и сразу удаляя "тихое" сообщение.
+    Приватная функция-обертка для безопасной отправки текстовых сообщений.
+    Дополнительные аргументы (reply_markup и т.п.) передаются в bot.send_message.
+    """
+    return await _deliver(db, user, functools.partial(bot.send_message, text=text, **send_options), update_status)
+
+
+SEND_MANY_BATCH_SIZE = 50 # Сколько отправок массовой рассылки выполняется параллельно
+
+async def _deliver_many(db: Session, deliveries: list[tuple[User, Any]]) -> tuple[int, list[dict]]:
+    """
+    Параллельная доставка многим пользователям: пары (пользователь, send) для _deliver,
+    пачками по SEND_MANY_BATCH_SIZE и в пределах общего лимита скорости.
+    Заблокировавшие бота помечаются одним UPDATE и одним коммитом в конце.
+    Возвращает (количество_успешных, список_неудач) - в формате,
+    который принимает send_broadcast_report_to_admin.
+    """
+    sent_count = 0
+    failed_users = []
+    for start in range(0, len(deliveries), SEND_MANY_BATCH_SIZE):
+        batch = deliveries[start:start + SEND_MANY_BATCH_SIZE]
+        results = await asyncio.gather(
+            *[_deliver(db, user, send, update_status=False) for user, send in batch],
+            return_exceptions=True
+        )
+        for (user, _), result in zip(batch, results):
+            if isinstance(result, BaseException):
+                failed_users.append({"user": user, "reason": str(result)})
+            elif result[0]:
+                sent_count += 1
+            else:
+                failed_users.append({"user": user, "reason": result[1]})
+
+    blocked_user_ids = [failure["user"].id for failure in failed_users if failure["reason"] == BOT_BLOCKED_REASON]
+    if blocked_user_ids:
+        await _execute(db, update(User).where(User.id.in_(blocked_user_ids)).values(bot_accessible=False))
+        await _commit(db)
+    return sent_count, failed_users
+
+
+async def send_bulk(db: Session, users: list[User], text: str) -> tuple[int, list[dict]]:
+    """Отправляет одно сообщение многим пользователям параллельно (см. _deliver_many)."""
+    send = functools.partial(bot.send_message, text=text)
+    return await _deliver_many(db, [(user, send) for user in users])
+
+
+async def send_many(db: Session, messages: list[tuple[User, str]]) -> tuple[int, list[dict]]:
+    """Отправляет каждому пользователю его собственный текст, параллельно (см. _deliver_many)."""
+    return await _deliver_many(
+        db, [(user, functools.partial(bot.send_message, text=text)) for user, text in messages]
+    )
+
+
+async def ping_user(db: Session, user: User, update_status: bool = True) -> bool:
+    """
+    Проверяет доступность пользователя через sendChatAction ("печатает..."):
+    один запрос, в чате ничего не появляется, а заблокировавший бота дает TelegramForbiddenError.
     Возвращает актуальный статус доступности (True/False).
+    При update_status=False статус в БД не трогается - его обновляет вызывающий код.
     """
     # Мы не можем полагаться на user.bot_accessible, так как пользователь мог разблокировать бота.
     # Поэтому мы всегда пытаемся отправить пинг.
     try:
-        # Отправляем "тихое" сообщение без уведомления на стороне клиента
-        sent_message = await bot.send_message(
-            chat_id=user.telegram_id, 
-            text=".", # Просто точка или любой другой минимальный символ
-            disable_notification=True
-        )
-        # Если отправка удалась, сразу удаляем это сообщение
-        await bot.delete_message(
-            chat_id=user.telegram_id, 
-            message_id=sent_message.message_id
-        )
+        async with telegram_send_limiter:
+            await bot.send_chat_action(chat_id=user.telegram_id, action="typing")
         
         # Если мы дошли до сюда, значит, бот доступен. Обновим статус в БД.
-        if not user.bot_accessible:
-            user.bot_accessible = True
-            db.add(user)
-            db.commit()
+        if update_status and not user.bot_accessible:
+            await _set_bot_accessible(db, user, True)
         return True
 
     except TelegramForbiddenError:
         # Пользователь заблокировал бота
-        if user.bot_accessible:
-            user.bot_accessible = False
-            db.add(user)
-            db.commit()
+        if update_status and user.bot_accessible:
+            await _set_bot_accessible(db, user, False)
         return False
     except Exception as e:
         # Другая ошибка (например, чат не найден)
-        logger.error(f"Ping failed for user {user.id}: {e}")
-        if user.bot_accessible:
-            user.bot_accessible = False
-            db.add(user)
-            db.commit()
+        logger.error("Ping failed for user %s: %s", user.id, e)
+        if update_status and user.bot_accessible:
+            await _set_bot_accessible(db, user, False)
         return False
 
-def _format_order_details_for_user(order: Order) -> str: # <-- Переименовываем
-    """Вспомогательная функция для форматирования деталей заказа для КЛИЕНТА."""
-    
+def _billing_full_name(order: Order) -> str:
+    """ФИО получателя из адреса (`billing`) заказа."""
+    billing = order.billing
+    return f"{billing.first_name or ''} {billing.last_name or ''}".strip()
+
+def _format_recipient_lines(order: Order, recipient_name: str | None = None) -> list[Text]:
+    """
+    Блок "Получатель" - общий для сообщений клиенту и админу.
+    recipient_name можно передать, если ФИО уже посчитано вызывающим кодом.
+    """
     billing = order.billing
-    recipient_name = f"{billing.first_name or ''} {billing.last_name or ''}".strip()
+    if recipient_name is None:
+        recipient_name = _billing_full_name(order)
     recipient_lines = []
-    if recipient_name: recipient_lines.append(f"<b>Получатель:</b> {recipient_name}")
-    if billing.phone: recipient_lines.append(f"<b>Номер телефона:</b> {billing.phone}")
-    if billing.email: recipient_lines.append(f"<b>Email:</b> {billing.email}")
-    
-    items_lines = ["<b>Состав заказа:</b>"]
-    for item in order.line_items:
-        items_lines.append(f"• {item.name} ({item.quantity} шт.) - {item.total} руб.")
-        
-    message_parts = [
-        f"✅ Заказ №<b>{order.number}</b> успешно оформлен!\n",
-        f"<b>Способ оплаты:</b> {order.payment_method_title}",
-    ]
-    message_parts.extend(recipient_lines)
-    
-    if recipient_lines: message_parts.append("")
-        
-    message_parts.extend(items_lines)
-    message_parts.append(f"\n<b>Итоговая сумма: {order.total} руб.</b>")
+    if recipient_name: recipient_lines.append(Text(Bold("Получатель:"), " ", recipient_name))
+    if billing.phone: recipient_lines.append(Text(Bold("Номер телефона:"), " ", billing.phone))
+    if billing.email: recipient_lines.append(Text(Bold("Email:"), " ", billing.email))
+    return recipient_lines
+
+# Сообщения о заказе собираются через aiogram.utils.formatting: текст уходит
+# вместе с готовыми entities, без HTML-разметки. Данные клиента (ФИО, email)
+# не нужно экранировать, а Telegram не разбирает HTML на своей стороне.
+
+def _format_order_details_for_user(order: Order) -> Text: # <-- Переименовываем
+    """Вспомогательная функция для форматирования деталей заказа для КЛИЕНТА."""
     
+    recipient_lines = _format_recipient_lines(order)
+
     if order.status == 'on-hold':
-        message_parts.append("\nСпасибо за ваш заказ! В ближайшее время с вами свяжется менеджер для подтверждения.")
+        thanks_text = "Спасибо за ваш заказ! В ближайшее время с вами свяжется менеджер для подтверждения."
     else:
-        message_parts.append("\nСпасибо за ваш заказ!")
-        
-    return "\n".join(message_parts)
+        thanks_text = "Спасибо за ваш заказ!"
+
+    return as_list(
+        Text("✅ Заказ №", Bold(order.number), " успешно оформлен!\n"),
+        Text(Bold("Способ оплаты:"), " ", order.payment_method_title),
+        *recipient_lines,
+        *([""] if recipient_lines else []),
+        Bold("Состав заказа:"),
+        *(f"• {item.name} ({item.quantity} шт.) - {item.total} руб." for item in order.line_items),
+        Text("\n", Bold(f"Итоговая сумма: {order.total} руб.")),
+        f"\n{thanks_text}",
+    )
 
-def _format_order_details_for_admin(order: Order) -> str:
+def _format_order_details_for_admin(order: Order, recipient_name: str | None = None) -> Text:
     """Форматирует детали заказа для АДМИНА (без "спасибо за заказ")."""
     
-    billing = order.billing
-    recipient_name = f"{billing.first_name or ''} {billing.last_name or ''}".strip()
-    recipient_lines = []
-    if recipient_name: recipient_lines.append(f"<b>Получатель:</b> {recipient_name}")
-    if billing.phone: recipient_lines.append(f"<b>Номер телефона:</b> {billing.phone}")
-    if billing.email: recipient_lines.append(f"<b>Email:</b> {billing.email}")
-
-    items_lines = ["<b>Состав заказа:</b>"]
-    for item in order.line_items:
+    recipient_lines = _format_recipient_lines(order, recipient_name)
+
+    return as_list(
+        Text("Заказ №", Bold(order.number)),
+        Text(Bold("Способ оплаты:"), " ", order.payment_method_title),
+        *recipient_lines,
+        *([""] if recipient_lines else []),
+        Bold("Состав заказа:"),
         # Убираем лишние нули и добавляем символ рубля для админа
-        price_per_item = float(item.price)
-        total_item_price = float(item.total)
-        items_lines.append(f"• {item.name} ({item.quantity} шт.) - {total_item_price:,.0f} ₽")
-
-    total_order_price = float(order.total)
-    
-    message_parts = [
-        f"Заказ №<b>{order.number}</b>",
-        f"<b>Способ оплаты:</b> {order.payment_method_title}",
-    ]
-    message_parts.extend(recipient_lines)
-    
-    if recipient_lines: message_parts.append("")
-        
-    message_parts.extend(items_lines)
-    message_parts.append(f"\n<b>Итоговая сумма: {total_order_price:,.0f} ₽</b>")
-    
-    return "\n".join(message_parts)
+        *(f"• {item.name} ({item.quantity} шт.) - {float(item.total):,.0f} ₽" for item in order.line_items),
+        Text("\n", Bold(f"Итоговая сумма: {float(order.total):,.0f} ₽")),
+    )
 
 
 async def send_new_order_confirmation(db: Session, user: User, order: Order):
@@ -156,33 +292,63 @@ async def send_new_order_confirmation(db: Session, user: User, order: Order):
     Уведомление о создании нового заказа (теперь принимает весь объект заказа).
     """
     message = _format_order_details_for_user(order)
-    await _send_message(db, user, message)
+    await _send_message(db, user, **message.as_kwargs())
+
+async def notify_new_order(db: Session, user: User, order: Order):
+    """
+    Уведомляет о новом заказе клиента и админский чат одновременно:
+    два независимых запроса к Telegram идут параллельно.
+    Ошибка одной отправки не мешает другой и не роняет создание заказа.
+    """
+    results = await asyncio.gather(
+        send_new_order_confirmation(db, user, order),
+        send_new_order_to_admin(order, user),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error("Failed to send new order notification for order %s: %s", order.id, result)
+
+# Шаблоны уведомлений клиенту: задаются один раз на уровне модуля
+ORDER_CANCELLED_TEMPLATE = "✅ Заказ №<b>{order_id}</b> был успешно отменен."
+ORDER_STATUS_TEMPLATE = "🔔 Статус вашего заказа №<b>{order_id}</b> изменен на: <b>{new_status_title}</b>"
+POINTS_EARNED_TEMPLATE = (
+    "💰 Вам начислено <b>{points_added} бонусных баллов</b> за заказ №<b>{order_id}</b>!\n\n"
+    "Используйте их для оплаты следующих покупок."
+)
+REFERRAL_BONUS_TEMPLATE = (
+    "🎉 Поздравляем! Ваш друг <b>{referred_user_name}</b> совершил первую покупку!\n\n"
+    "Вам начислено <b>{points_added} бонусных баллов</b> в качестве вознаграждения. Спасибо, что вы с нами!"
+)
+
 async def send_order_cancellation_confirmation(db: Session, user: User, order_id: int):
     """Уведомление об отмене заказа."""
-    message = f"✅ Заказ №<b>{order_id}</b> был успешно отменен."
+    message = ORDER_CANCELLED_TEMPLATE.format_map({"order_id": order_id})
     await _send_message(db, user, message)
 
 async def send_order_status_update(db: Session, user: User, order_id: int, new_status_title: str):
     """Уведомление об изменении статуса заказа."""
-    message = f"🔔 Статус вашего заказа №<b>{order_id}</b> изменен на: <b>{new_status_title}</b>"
+    message = ORDER_STATUS_TEMPLATE.format_map({"order_id": order_id, "new_status_title": new_status_title})
     await _send_message(db, user, message)
 
 async def send_points_earned(db: Session, user: User, points_added: int, order_id: int):
     """Уведомление о начислении бонусных баллов."""
-    message = (
-        f"💰 Вам начислено <b>{points_added} бонусных баллов</b> за заказ №<b>{order_id}</b>!\n\n"
-        f"Используйте их для оплаты следующих покупок."
-    )
+    message = POINTS_EARNED_TEMPLATE.format_map({"points_added": points_added, "order_id": order_id})
     await _send_message(db, user, message)
 
 async def send_referral_bonus(db: Session, user: User, referred_user_name: str, points_added: int):
     """Уведомление о начислении бонуса за покупку приглашенного пользователя."""
-    message = (
-        f"🎉 Поздравляем! Ваш друг <b>{referred_user_name}</b> совершил первую покупку!\n\n"
-        f"Вам начислено <b>{points_added} бонусных баллов</b> в качестве вознаграждения. Спасибо, что вы с нами!"
-    )
+    message = REFERRAL_BONUS_TEMPLATE.format_map({"referred_user_name": referred_user_name, "points_added": points_added})
     await _send_message(db, user, message)
 
+# Клавиатура запроса контакта одинакова для всех - создается один раз.
+# Исчезает после одного нажатия.
+CONTACT_REQUEST_KEYBOARD = ReplyKeyboardMarkup(
+    keyboard=[[KeyboardButton(text="📞 Поделиться контактом", request_contact=True)]],
+    resize_keyboard=True,
+    one_time_keyboard=True
+)
+
 async def request_contact_from_user(db: Session, user: User, admin_name: str):
     """
     Отправляет пользователю сообщение с кнопкой запроса контакта,
@@ -192,130 +358,117 @@ async def request_contact_from_user(db: Session, user: User, admin_name: str):
         f"👋 Здравствуйте! Менеджер <b>{admin_name}</b> хотел бы связаться с вами для уточнения деталей заказа. "
         f"Пожалуйста, нажмите на кнопку ниже, чтобы поделиться вашим номером телефона."
     )
-    
-    # --- ИЗМЕНЕНИЕ ЗДЕСЬ: Используем ReplyKeyboardBuilder ---
-    builder = ReplyKeyboardBuilder()
-    # Создаем кнопку с параметром request_contact
-    builder.add(KeyboardButton(text="📞 Поделиться контактом", request_contact=True))
-    
-    # Конфигурируем клавиатуру, чтобы она исчезла после одного нажатия
-    keyboard = builder.as_markup(
-        resize_keyboard=True, 
-        one_time_keyboard=True
-    )
-    # --------------------------------------------------------
 
-    if not user.bot_accessible:
-        logger.info(f"Skipping contact request for user {user.id}: bot is marked as inaccessible.")
-        return
+    await _send_message(db, user, message_text, reply_markup=CONTACT_REQUEST_KEYBOARD)
 
-    try:
-        await bot.send_message(
-            chat_id=user.telegram_id,
-            text=message_text,
-            reply_markup=keyboard # <-- Передаем новую клавиатуру
-        )
-    except TelegramForbiddenError:
-        logger.warning(f"User {user.id} has blocked the bot. Updating status.")
-        user.bot_accessible = False
-        db.add(user)
-        db.commit()
-    except Exception as e:
-        logger.error(f"Failed to send contact request to user {user.id}: {e}")
+# Префикс ссылки на заказ в админке WP - постоянный, считаем один раз при импорте
+_WP_POST_URL = f"{settings.WP_URL}/wp-admin/post.php?post="
+
+def _new_order_admin_keyboard(order_id: int, customer_telegram_id: int | None) -> InlineKeyboardMarkup:
+    """
+    Клавиатура под уведомлением о новом заказе (по 2 кнопки в ряд).
+    Собирается сразу в InlineKeyboardMarkup через model_construct: все значения формируем мы сами,
+    поэтому pydantic-валидация на каждый новый заказ не нужна.
+    """
+    # Deep link для открытия заказа в мобильном приложении WooCommerce
+    wp_button = InlineKeyboardButton.model_construct(text="🔗 Заказ в WP", url=f"{_WP_POST_URL}{order_id}&action=edit")
+    if not customer_telegram_id:
+        return InlineKeyboardMarkup.model_construct(inline_keyboard=[[wp_button]])
+
+    return InlineKeyboardMarkup.model_construct(inline_keyboard=[
+        [
+            InlineKeyboardButton.model_construct(text="👤 Написать клиенту", url=f"tg://user?id={customer_telegram_id}"),
+            InlineKeyboardButton.model_construct(text="🤖 Ответить от бота", callback_data=ReplyToCallback(telegram_id=customer_telegram_id).pack()),
+        ],
+        [
+            InlineKeyboardButton.model_construct(text="📞 Запросить контакт", callback_data=RequestContactCallback(telegram_id=customer_telegram_id).pack()),
+            wp_button,
+        ],
+    ])
 
 async def send_new_order_to_admin(order: Order, customer: User):
     """Отправляет детали нового заказа в админский чат."""
-    message_text = _format_order_details_for_admin(order)
-    
     # --- ИСПРАВЛЕНИЕ ЗДЕСЬ ---
-    # Берем ФИО из адреса (`billing`) самого заказа, а не из объекта User
-    billing_info = order.billing
-    customer_name = f"{billing_info.first_name or ''} {billing_info.last_name or ''}".strip()
+    # Берем ФИО из адреса (`billing`) самого заказа, а не из объекта User.
+    # Считаем один раз и передаем в форматирование деталей заказа
+    customer_name = _billing_full_name(order)
+    message_text = _format_order_details_for_admin(order, customer_name)
     
     # Используем username из нашего объекта User как дополнительную информацию
-    customer_info = f"👤 <b>Клиент:</b> {customer_name}"
+    customer_info = Text("👤 ", Bold("Клиент:"), " ", customer_name)
     if customer.username:
         customer_info += f" (@{customer.username})"
     
-    admin_message = f"<b>🔥 Новый заказ!</b>\n{customer_info}\n\n{message_text}"
+    admin_message = Text(Bold("🔥 Новый заказ!"), "\n", customer_info, "\n\n", message_text)
     # --------------------------------
 
-    builder = InlineKeyboardBuilder()
-    
-    customer_telegram_id = order.customer_telegram_id
-    if customer_telegram_id:
-        builder.button(text="👤 Написать клиенту", url=f"tg://user?id={customer_telegram_id}")
-        builder.button(text="🤖 Ответить от бота", callback_data=f"reply_to:{customer_telegram_id}")
-        # --- НОВАЯ КНОПКА ЗАПРОСА КОНТАКТА ---
-        builder.button(text="📞 Запросить контакт", callback_data=f"request_contact:{customer_telegram_id}")
-    
-    # --- НОВАЯ DEEP LINK ССЫЛКА ---
-    # Deep link для открытия заказа в мобильном приложении WooCommerce
-    builder.button(text="🔗 Заказ в WP", url=f"{settings.WP_URL}/wp-admin/post.php?post={order.id}&action=edit")
-    builder.adjust(2)
-
-    await bot.send_message(
-        chat_id=settings.ADMIN_CHAT_ID,
-        text=admin_message,
-        reply_markup=builder.as_markup()
+    await _send_to_chat(
+        bot.send_message,
+        settings.ADMIN_CHAT_ID,
+        reply_markup=_new_order_admin_keyboard(order.id, order.customer_telegram_id),
+        **admin_message.as_kwargs()
     )
 
+REPORT_MAX_REASONS = 10 # Сколько разных причин ошибок показывать в отчете о рассылке
+REPORT_TEXT_LIMIT = 4000 # Лимит сообщения Telegram - 4096 символов, оставляем запас
+
 async def send_broadcast_report_to_admin(broadcast_id: int, sent_count: int, failed_users_info: list):
-    """Отправляет итоговый отчет о рассылке в админский чат."""
+    """
+    Отправляет итоговый отчет о рассылке в админский чат.
+    Отчет собирается через aiogram.utils.formatting (текст + entities, без HTML):
+    причины ошибок и имена пользователей не нужно экранировать.
+    """
     
     failed_count = len(failed_users_info)
     total_processed = sent_count + failed_count
 
     report_lines = [
-        f"<b>📊 Отчет по рассылке #{broadcast_id}</b>\n",
-        f"✅ <b>Успешно отправлено:</b> {sent_count}",
-        f"❌ <b>Не удалось отправить:</b> {failed_count}",
-        f"👥 <b>Всего обработано:</b> {total_processed}\n"
+        Text(Bold(f"📊 Отчет по рассылке #{broadcast_id}"), "\n"),
+        Text("✅ ", Bold("Успешно отправлено:"), f" {sent_count}"),
+        Text("❌ ", Bold("Не удалось отправить:"), f" {failed_count}"),
+        Text("👥 ", Bold("Всего обработано:"), f" {total_processed}\n"),
     ]
 
     if failed_count > 0:
-        report_lines.append("<b>Список неудачных отправок:</b>")
-        
-        # Ограничим вывод, чтобы не спамить в чат, если ошибок много
-        for i, failure in enumerate(failed_users_info[:10]):
+        # Группируем неудачи по причине: одна строка на причину, а не на пользователя
+        reason_counts = Counter(failure['reason'] for failure in failed_users_info)
+        report_lines.append(Bold("Причины неудачных отправок:"))
+        report_lines.extend(
+            Text("• ", Italic(str(reason)), f" - {count}")
+            for reason, count in reason_counts.most_common(REPORT_MAX_REASONS)
+        )
+        if len(reason_counts) > REPORT_MAX_REASONS:
+            report_lines.append(Text("\n", Italic(f"... и еще {len(reason_counts) - REPORT_MAX_REASONS} причин.")))
+
+        # Список пользователей-ссылок - сколько поместится в одно сообщение
+        report_lines.append(Text("\n", Bold("Неудачные отправки:")))
+        report_length = len(as_list(*report_lines).as_kwargs()["text"])
+        shown_count = 0
+        for failure in failed_users_info:
             user = failure['user']
-            reason = failure['reason']
-            user_info = f"<a href='tg://user?id={user.telegram_id}'>{user.username or user.telegram_id}</a>"
-            report_lines.append(f"{i+1}. {user_info} - <i>Причина: {reason}</i>")
-            
-        if failed_count > 10:
-            report_lines.append(f"\n<i>... и еще {failed_count - 10} пользователей.</i>")
+            user_line = Text(
+                f"{shown_count + 1}. ",
+                TextLink(str(user.username or user.telegram_id), url=f"tg://user?id={user.telegram_id}")
+            )
+            line_length = len(user_line.as_kwargs()["text"]) + 1
+            if report_length + line_length > REPORT_TEXT_LIMIT:
+                break
+            report_lines.append(user_line)
+            report_length += line_length
+            shown_count += 1
 
-    report_text = "\n".join(report_lines)
+        if failed_count > shown_count:
+            report_lines.append(Text("\n", Italic(f"... и еще {failed_count - shown_count} пользователей.")))
 
     # Отправляем отчет в админский чат
-    await bot.send_message(
-        chat_id=settings.ADMIN_CHAT_ID,
-        text=report_text,
-        parse_mode="HTML"
-    )
+    await _send_to_chat(bot.send_message, settings.ADMIN_CHAT_ID, **as_list(*report_lines).as_kwargs())
 
 async def send_photo_to_user(db: Session, user: User, photo_id: str, caption: str) -> bool:
     """Безопасно отправляет фото пользователю."""
-    if not user.bot_accessible:
-        return False
-        
-    try:
-        await bot.send_photo(
-            chat_id=user.telegram_id, 
-            photo=photo_id, 
-            caption=caption,
-            parse_mode="HTML"
-        )
-        return True
-    except TelegramForbiddenError:
-        user.bot_accessible = False
-        db.add(user)
-        db.commit()
-        return False
-    except Exception as e:
-        logger.error(f"Failed to send photo to user {user.id}: {e}")
-        return False
+    success, _ = await _deliver(
+        db, user, functools.partial(bot.send_photo, photo=photo_id, caption=caption)
+    )
+    return success
     
 async def send_points_expired_notification(db: Session, user: User, points_expired: int):
     """Уведомление о сгорании бонусных баллов."""
@@ -326,8 +479,8 @@ async def send_points_expired_notification(db: Session, user: User, points_expir
     )
     await _send_message(db, user, message)
 
-async def send_points_expiring_soon_notification(db: Session, user: User, points_expiring: int, days_left: int):
-    """Уведомление о скором сгорании баллов."""
+def format_points_expiring_soon_message(points_expiring: int, days_left: int) -> str:
+    """Текст уведомления о скором сгорании баллов."""
     # Выбираем правильное склонение для слова "день"
     day_word = "дней"
     if days_left == 1:
@@ -343,26 +496,18 @@ async def send_points_expiring_soon_notification(db: Session, user: User, points
     # Можно добавить кнопку, ведущую в магазин
     # builder = InlineKeyboardBuilder()
     # builder.button(text="🛍️ Потратить баллы", web_app=...)
-    
-    await _send_message(db, user, message)
+    return message
 
+async def send_points_expiring_soon_notification(db: Session, user: User, points_expiring: int, days_left: int):
+    """Уведомление о скором сгорании баллов."""
+    await _send_message(db, user, format_points_expiring_soon_message(points_expiring, days_left))
 
-async def send_promo_notification(
-    db: Session,
-    user: User,
-    title: str,
-    text: str,
-    image_url: str | None,
-    action_url: str | None
-):
+
+def _promo_sender(title: str, text: str, image_url: str | None, action_url: str | None):
     """
-    Отправляет пользователю промо-уведомление (акцию).
-    Поддерживает отправку с картинкой и кнопкой-ссылкой в Mini App.
+    Собирает отправку промо-уведомления (текст, картинка, кнопка-ссылка в Mini App)
+    для _deliver. Не зависит от получателя, поэтому для рассылки собирается один раз.
     """
-    if not user.bot_accessible:
-        logger.info(f"Skipping promo for user {user.id}: bot is marked as inaccessible.")
-        return
-
     full_text = f"<b>{title}</b>\n\n{text}"
     if image_url and len(full_text) > 1024:
         full_text = full_text[:1020] + "..."
@@ -394,33 +539,44 @@ async def send_promo_notification(
                 )
                 reply_markup = builder.as_markup()
             except (ValueError, TypeError):
-                logger.warning(f"Generated action_url '{full_action_url}' is not a valid URL. Sending promo without a button.")
+                logger.warning("Generated action_url '%s' is not a valid URL. Sending promo without a button.", full_action_url)
         else:
-            logger.warning(f"Provided action_url '{action_url}' is not a valid relative or absolute URL. Sending promo without a button.")
+            logger.warning("Provided action_url '%s' is not a valid relative or absolute URL. Sending promo without a button.", action_url)
         # -----------------------------------------------
 
-    try:
-        if image_url:
-            await bot.send_photo(
-                chat_id=user.telegram_id,
-                photo=image_url,
-                caption=full_text,
-                reply_markup=reply_markup
-            )
-        else:
-            await bot.send_message(
-                chat_id=user.telegram_id,
-                text=full_text,
-                reply_markup=reply_markup,
-                disable_web_page_preview=True
-            )
-    except TelegramForbiddenError:
-        print(f"User {user.id} has blocked the bot while sending promo. Updating status.")
-        user.bot_accessible = False
-        db.add(user)
-        db.commit()
-    except Exception as e:
-        print(f"Failed to send promo notification to user {user.id}: {e}")
+    if image_url:
+        send = functools.partial(bot.send_photo, photo=image_url, caption=full_text, reply_markup=reply_markup)
+    else:
+        send = functools.partial(bot.send_message, text=full_text, reply_markup=reply_markup, disable_web_page_preview=True)
+    return send
+
+
+async def send_promo_notification(
+    db: Session,
+    user: User,
+    title: str,
+    text: str,
+    image_url: str | None,
+    action_url: str | None
+):
+    """
+    Отправляет пользователю промо-уведомление (акцию).
+    Поддерживает отправку с картинкой и кнопкой-ссылкой в Mini App.
+    """
+    await _deliver(db, user, _promo_sender(title, text, image_url, action_url))
+
+
+async def send_promo_to_users(
+    db: Session,
+    users: list[User],
+    title: str,
+    text: str,
+    image_url: str | None,
+    action_url: str | None
+) -> tuple[int, list[dict]]:
+    """Рассылает промо-уведомление многим пользователям параллельно (см. _deliver_many)."""
+    send = _promo_sender(title, text, image_url, action_url)
+    return await _deliver_many(db, [(user, send) for user in users])
 
 
 async def send_error_to_super_admins(error_message: str):
@@ -431,25 +587,16 @@ async def send_error_to_super_admins(error_message: str):
         logger.warning("SUPER_ADMIN_IDS is not set. Critical error cannot be sent.")
         return
 
-    # Используем asyncio.gather для параллельной отправки всем суперадминам
-    tasks = []
-    for admin_id in settings.SUPER_ADMIN_IDS:
-        try:
-            # Обрезаем сообщение, если оно слишком длинное (лимит Telegram 4096 символов)
-            if len(error_message) > 4096:
-                error_message = error_message[:4090] + "\n[...]"
-            
-            task = bot.send_message(
-                chat_id=admin_id,
-                text=error_message,
-                parse_mode="HTML"
-            )
-            tasks.append(task)
-        except Exception as e:
-            logger.error(f"Failed to create send_message task for super admin {admin_id}: {e}")
+    # Обрезаем сообщение один раз для всех админов (лимит Telegram 4096 символов)
+    if len(error_message) > 4096:
+        error_message = error_message[:4090] + "\n[...]"
 
-    if tasks:
-        await asyncio.gather(*tasks, return_exceptions=True) # return_exceptions=True, чтобы не упасть, если один из админов заблокировал бота
+    # Используем asyncio.gather для параллельной отправки всем суперадминам
+    tasks = [
+        _send_to_chat(bot.send_message, admin_id, text=error_message)
+        for admin_id in settings.SUPER_ADMIN_IDS
+    ]
+    await asyncio.gather(*tasks, return_exceptions=True) # return_exceptions=True, чтобы не упасть, если один из админов заблокировал бота
 
 async def send_birthday_greeting(db: Session, user: User, points_added: int):
     """Поздравляет пользователя с Днем Рождения."""
@@ -495,11 +642,7 @@ async def send_order_cancellation_to_admin(order_id: int, user: User):
     builder = InlineKeyboardBuilder()
     builder.button(text="🔗 Посмотреть заказ в WP", url=f"{settings.WP_URL}/wp-admin/post.php?post={order_id}&action=edit")
     
-    await bot.send_message(
-        chat_id=settings.ADMIN_CHAT_ID,
-        text=message,
-        reply_markup=builder.as_markup()
-    )
+    await _send_to_chat(bot.send_message, settings.ADMIN_CHAT_ID, text=message, reply_markup=builder.as_markup())
 
 
 async def send_welcome_bonus(db: Session, user: User, points_added: int):
@@ -524,6 +667,11 @@ async def send_points_refund_notification(db: Session, user: User, points_refund
     )
     await _send_message(db, user, message)
 
+# Кнопка "в каталог" для сообщений активации/реактивации - одна на всех, создается один раз
+CATALOG_KEYBOARD = InlineKeyboardMarkup(
+    inline_keyboard=[[InlineKeyboardButton(text="🛍️ Перейти в каталог", web_app=WebAppInfo(url=settings.MINI_APP_URL))]]
+)
+
 async def send_activation_notification(db: Session, user: User, promo_code: str):
     """Сообщение для нового пользователя без покупок."""
     message = (
@@ -531,10 +679,9 @@ async def send_activation_notification(db: Session, user: User, promo_code: str)
         f"Чтобы сделать шоппинг еще приятнее, дарим вам персональный промокод на скидку: <code>{promo_code}</code> 🎁\n\n"
         f"Он с нетерпением ждет вас в корзине!"
     )
-    # Можно добавить кнопку, ведущую в каталог
-    builder = InlineKeyboardBuilder()
-    builder.button(text="🛍️ Перейти в каталог", web_app=WebAppInfo(url=settings.MINI_APP_URL))
-    
+    # Отправка пока не включена: промокоды в customer_engagement - заглушки.
+    # При включении: await _send_message(db, user, message, reply_markup=CATALOG_KEYBOARD)
+
 async def send_reactivation_notification(db: Session, user: User, promo_code: str):
     """Сообщение для "спящего" пользователя."""
     message = (
@@ -542,6 +689,5 @@ async def send_reactivation_notification(db: Session, user: User, promo_code: st
         f"Мы соскучились и хотим порадовать вас! Дарим вам персональный промокод на скидку: <code>{promo_code}</code> 🎁\n\n"
         f"Заглядывайте в наш каталог, у нас много новинок!"
     )
-    builder = InlineKeyboardBuilder()
-    builder.button(text="🛍️ Перейти в каталог", web_app=WebAppInfo(url=settings.MINI_APP_URL))
+    # Отправка пока не включена (см. send_activation_notification)
     
\ No newline at end of file
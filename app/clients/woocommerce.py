@@ -12,12 +12,20 @@ class WooCommerceClient:
         # --- ИЗМЕНЕНИЕ ЗДЕСЬ: Устанавливаем таймауты ---
         # 30 секунд - более чем достаточный и безопасный таймаут для большинства операций
         timeouts = httpx.Timeout(10.0, connect=30.0)
+        # Один долгоживущий клиент на процесс: TLS-соединения с WordPress переиспользуются
+        limits = httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=60)
         
         self.async_client = httpx.AsyncClient(
             auth=self.auth, 
             base_url=self.base_url,
-            timeout=timeouts # <-- Применяем новые таймауты
+            timeout=timeouts, # <-- Применяем новые таймауты
+            limits=limits
         )
+
+    async def close(self):
+        """Закрывает пул соединений (при остановке приложения)."""
+        await self.async_client.aclose()
+
     async def get(self, endpoint: str, params: dict = None):
         try:
             # Теперь endpoint должен содержать полный путь от /wp-json/
@@ -1,5 +1,6 @@
 import json
-from typing import Any, Dict, List
+from functools import cached_property
+from typing import Any, Dict, List, Optional, Tuple
 from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -10,6 +11,16 @@ class Settings(BaseSettings):
     DATABASE_HOST: str
     DATABASE_PORT: int
     DATABASE_NAME: str
+    # Пул соединений (на каждый воркер gunicorn). Синхронный пул (API) + асинхронный (бот):
+    # по умолчанию до 10 + 5 = 15 соединений на процесс
+    DATABASE_POOL_SIZE: int = 5
+    DATABASE_MAX_OVERFLOW: int = 5
+    DATABASE_ASYNC_POOL_SIZE: int = 3
+    DATABASE_ASYNC_MAX_OVERFLOW: int = 2
+    DATABASE_POOL_TIMEOUT: int = 30
+    DATABASE_POOL_RECYCLE: int = 1800 # секунд
+    # Подключение идет через pgbouncer в transaction mode (серверные prepared statements недоступны)
+    DATABASE_USES_POOLER: bool = False
 
     # Настройки WordPress
     WP_URL: str
@@ -34,6 +45,8 @@ class Settings(BaseSettings):
     ADMIN_CHAT_ID: int
     WP_PROMO_WEBHOOK_SECRET: str
     SHOP_SETTINGS_PAGE_ID: int
+    # Показывать в списках админа ФИО из WooCommerce даже при наличии username (лишний запрос в WC)
+    PREFER_WC_BILLING_NAME: bool = False
 
     SUPER_ADMIN_IDS_STR: str = Field(alias="SUPER_ADMIN_IDS")
 
@@ -41,11 +54,12 @@ class Settings(BaseSettings):
     def ADMIN_TELEGRAM_IDS(self) -> List[int]:
         return [int(admin_id.strip()) for admin_id in self.ADMIN_TELEGRAM_IDS_STR.split(',')]
 
-    @property
-    def SUPER_ADMIN_IDS(self) -> List[int]:
+    # Строка из .env не меняется после загрузки - парсим ее один раз
+    @cached_property
+    def SUPER_ADMIN_IDS(self) -> Tuple[int, ...]:
         if not self.SUPER_ADMIN_IDS_STR:
-            return []
-        return [int(admin_id.strip()) for admin_id in self.SUPER_ADMIN_IDS_STR.split(',')]
+            return ()
+        return tuple(int(admin_id.strip()) for admin_id in self.SUPER_ADMIN_IDS_STR.split(','))
     
     # Это свойство будет автоматически парсить JSON в словарь
     LOYALTY_SETTINGS: Dict[str, Any] = {}
@@ -53,6 +67,9 @@ class Settings(BaseSettings):
     TELEGRAM_BOT_TOKEN: str
     BASE_WEBHOOK_URL: str
     TELEGRAM_WEBHOOK_SECRET: str
+    # Адрес собственного Bot API сервера (tdlib/telegram-bot-api), например http://bot-api:8081.
+    # Пусто - используется api.telegram.org
+    TELEGRAM_API_SERVER_URL: Optional[str] = None
     MINI_APP_URL: str
     MINI_APP_URL_ADMIN: str
     
@@ -75,6 +92,10 @@ class Settings(BaseSettings):
     @property
     def DATABASE_URL(self) -> str:
         return f"postgresql+psycopg2://{self.DATABASE_USER}:{self.DATABASE_PASSWORD}@{self.DATABASE_HOST}:{self.DATABASE_PORT}/{self.DATABASE_NAME}"
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        # Тот же Postgres, но через асинхронный драйвер asyncpg (для бота)
+        return f"postgresql+asyncpg://{self.DATABASE_USER}:{self.DATABASE_PASSWORD}@{self.DATABASE_HOST}:{self.DATABASE_PORT}/{self.DATABASE_NAME}"
 
     model_config = SettingsConfigDict(env_file=".env")
 
@@ -10,4 +10,22 @@ ERROR_ITEM_NOT_IN_FAVORITES = "Товар не найден в избранно
 SUCCESS_CART_UPDATED = "Корзина обновлена."
 SUCCESS_ITEM_REMOVED_FROM_CART = "Товар удален из корзины."
 SUCCESS_ADDED_TO_FAVORITES = "Товар добавлен в избранное."
-SUCCESS_REMOVED_FROM_FAVORITES = "Товар удален из избранного."
\ No newline at end of file
+SUCCESS_REMOVED_FROM_FAVORITES = "Товар удален из избранного."
+
+# --- Тексты админ-бота ---
+ADMIN_HELP_TEXT = (
+    "🤖 <b>Панель администратора</b>\n\n"
+    "<b>Статистика:</b>\n"
+    "<code>/stats</code> - общая статистика по пользователям\n\n"
+    "<b>Поиск пользователя:</b>\n"
+    "<code>/find_user &lt;ID/TG_ID/username&gt;</code>\n\n"
+    "<b>Управление акциями:</b>\n"
+    "<code>/promo_welcome &lt;сумма&gt;</code>\n"
+    "<code>/promo_welcome on|off</code>\n\n"
+    "<b>Рассылки (в админ-группе):</b>\n"
+    "Ответьте на сообщение командой:\n"
+    "<code>/send_broadcast &lt;all|bronze|silver|gold&gt;</code>"
+)
+ERROR_USER_NOT_FOUND = "Пользователь не найден."
+ERROR_USER_NOT_FOUND_ALERT = "❌ Пользователь не найден."
+ERROR_GENERIC_ALERT = "Произошла ошибка."
@@ -1,13 +1,88 @@
 # app/core/redis.py
+import asyncio
+import logging
+from typing import Callable
+
 import redis.asyncio as redis
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 # Создаем асинхронный клиент Redis
 # decode_responses=True автоматически декодирует ответы из байтов в строки
 redis_client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
 
+# Канал, в который публикуются имена сброшенных ключей кеша
+CACHE_INVALIDATION_CHANNEL = "cache:invalidate"
+
+# Локальные (in-process) кеши, которые нужно сбросить при инвалидации ключа
+_invalidation_handlers: dict[str, list[Callable[[], None]]] = {}
+
 async def get_redis_client():
     """
     Зависимость для получения клиента Redis в эндпоинтах.
     """
-    return redis_client
\ No newline at end of file
+    return redis_client
+
+async def invalidate_many(keys: list[str]):
+    """
+    Удаляет несколько ключей кеша и оповещает об этом остальные воркеры
+    за один round trip (pipeline без транзакции).
+    """
+    if not keys:
+        return
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.delete(*keys)
+        for key in keys:
+            pipe.publish(CACHE_INVALIDATION_CHANNEL, key)
+        await pipe.execute()
+
+def on_cache_invalidated(key: str, handler: Callable[[], None]):
+    """Регистрирует сброс локального кеша процесса при инвалидации ключа `key`."""
+    _invalidation_handlers.setdefault(key, []).append(handler)
+
+CACHE_LISTENER_RETRY_SECONDS = 5
+
+def _reset_all_local_caches():
+    """Сбрасывает все локальные кеши: пока подписки не было, инвалидации могли быть пропущены."""
+    for handlers in _invalidation_handlers.values():
+        for handler in handlers:
+            try:
+                handler()
+            except Exception as e:
+                logger.warning("Local cache reset failed: %s", e)
+
+async def _listen_cache_invalidations():
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    try:
+        await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+        async for message in pubsub.listen():
+            for handler in _invalidation_handlers.get(message["data"], []):
+                try:
+                    handler()
+                except Exception as e:
+                    logger.warning("Cache invalidation handler for '%s' failed: %s", message["data"], e)
+    finally:
+        await pubsub.aclose()
+
+async def run_cache_invalidation_listener():
+    """
+    Фоновая задача воркера: слушает канал инвалидации и сбрасывает
+    локальные кеши процесса, чтобы изменения доходили до всех воркеров сразу.
+    При потере соединения с Redis переподключается, а после переподключения
+    сбрасывает локальные кеши целиком.
+    """
+    reconnecting = False
+    while True:
+        try:
+            if reconnecting:
+                _reset_all_local_caches()
+            await _listen_cache_invalidations()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(
+                "Cache invalidation listener failed: %s. Reconnecting in %ss.", e, CACHE_LISTENER_RETRY_SECONDS
+            )
+        reconnecting = True
+        await asyncio.sleep(CACHE_LISTENER_RETRY_SECONDS)
@@ -1,5 +1,6 @@
 # app/crud/referral.py
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.referral import Referral
 
 def create_referral(db: Session, referrer_id: int, referred_id: int) -> Referral:
@@ -10,6 +11,13 @@ def create_referral(db: Session, referrer_id: int, referred_id: int) -> Referral
     db.refresh(db_referral)
     return db_referral
 
+async def create_referral_async(db: AsyncSession, referrer_id: int, referred_id: int) -> Referral:
+    """Создает новую реферальную связь (асинхронная версия)."""
+    db_referral = Referral(referrer_id=referrer_id, referred_id=referred_id)
+    db.add(db_referral)
+    await db.commit()
+    return db_referral
+
 def get_referral_by_referred_id(db: Session, referred_id: int) -> Referral | None:
     """Находит реферальную связь по ID приглашенного пользователя."""
     return db.query(Referral).filter(Referral.referred_id == referred_id).first()
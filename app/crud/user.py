@@ -1,8 +1,9 @@
 # app/crud/user.py
 from datetime import date, datetime, timedelta
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.user import User
-from sqlalchemy import Date, cast, func
+from sqlalchemy import Date, cast, func, literal_column, select, update
 from sqlalchemy import or_
 from sqlalchemy import extract
 
@@ -51,6 +52,10 @@ def count_users_by_level(db: Session, level: str) -> int:
 def count_users_with_bot_blocked(db: Session) -> int:
     return db.query(User).filter(User.bot_accessible == False).count()
 
+# ФИО для поиска. Пробел - литерал, а не параметр, чтобы выражение совпадало
+# с триграммным индексом ix_users_full_name_trgm (см. миграцию 7e1c0b98f668).
+USER_FULL_NAME = User.first_name + literal_column("' '") + User.last_name
+
 def find_users(db: Session, query: str, limit: int = 10) -> list[User]:
     """Ищет пользователей по ID, telegram_id, username или ФИО."""
     search_query = f"%{query.lstrip('@')}%"
@@ -59,7 +64,7 @@ def find_users(db: Session, query: str, limit: int = 10) -> list[User]:
     filter_conditions = [
         User.username.ilike(search_query),
         # Ищем по полному имени (Иван Петров)
-        (User.first_name + ' ' + User.last_name).ilike(search_query),
+        USER_FULL_NAME.ilike(search_query),
     ]
     
     if query.isdigit():
@@ -95,7 +100,7 @@ def get_users(
         search_query = f"%{search}%"
         search_filter = [
             User.username.ilike(search_query),
-            (User.first_name + ' ' + User.last_name).ilike(search_query),
+            USER_FULL_NAME.ilike(search_query),
             (User.last_name + ' ' + User.first_name).ilike(search_query),
         ]
         if search.isdigit():
@@ -126,7 +131,7 @@ def count_users_with_filters(
         search_query = f"%{search}%"
         search_filter = [
             User.username.ilike(search_query),
-            (User.first_name + ' ' + User.last_name).ilike(search_query),
+            USER_FULL_NAME.ilike(search_query),
             (User.last_name + ' ' + User.first_name).ilike(search_query),
         ]
         if search.isdigit():
@@ -174,4 +179,172 @@ def update_user_phone(db: Session, user: User, phone: str) -> User:
 
 def get_users_registered_on_date(db: Session, target_date: date) -> list[User]:
     """Находит всех пользователей, зарегистрированных в определенный день."""
-    return db.query(User).filter(cast(User.created_at, Date) == target_date).all()
\ No newline at end of file
+    return db.query(User).filter(cast(User.created_at, Date) == target_date).all()
+
+
+# --- Асинхронные версии для хендлеров бота (AsyncSession) ---
+
+def _apply_user_filters(query, level: str | None, bot_blocked: bool | None):
+    """Применяет фильтры списка пользователей к select()-запросу."""
+    if level and level != 'all':
+        query = query.where(User.level == level)
+    if bot_blocked is not None:
+        query = query.where(User.bot_accessible != bot_blocked)
+    return query
+
+async def get_user_by_id_async(db: AsyncSession, user_id: int) -> User | None:
+    """
+    Получает пользователя по его первичному ключу (ID в нашей БД).
+    Session.get сначала смотрит в identity map и не ходит в БД повторно.
+    """
+    return await db.get(User, user_id)
+
+async def get_user_by_telegram_id_async(db: AsyncSession, telegram_id: int) -> User | None:
+    """Получает пользователя по его Telegram ID."""
+    result = await db.execute(select(User).where(User.telegram_id == telegram_id))
+    return result.scalar_one_or_none()
+
+async def get_user_by_referral_code_async(db: AsyncSession, code: str) -> User | None:
+    return await db.scalar(select(User).where(User.referral_code == code).limit(1))
+
+async def create_user_async(
+    db: AsyncSession,
+    telegram_id: int,
+    wordpress_id: int,
+    username: str | None,
+    referral_code: str,
+    first_name: str | None,
+    last_name: str | None
+) -> User:
+    """Создает нового пользователя в нашей БД (асинхронная версия create_user)."""
+    db_user = User(
+        telegram_id=telegram_id,
+        wordpress_id=wordpress_id,
+        username=username,
+        referral_code=referral_code,
+        first_name=first_name,
+        last_name=last_name
+    )
+    db.add(db_user)
+    await db.commit()
+    # Подгружаем значения по умолчанию из БД (created_at, level и т.п.)
+    await db.refresh(db_user)
+    return db_user
+
+async def get_users_by_telegram_ids_async(db: AsyncSession, telegram_ids: list[int], limit: int = 10) -> list[User]:
+    """Получает пользователей по списку Telegram ID."""
+    result = await db.execute(select(User).where(User.telegram_id.in_(telegram_ids)).limit(limit))
+    return list(result.scalars().all())
+
+async def get_user_stats_async(db: AsyncSession) -> dict[str, int]:
+    """
+    Считает общую статистику по пользователям одним запросом
+    (условные агрегаты COUNT(*) FILTER (WHERE ...)).
+    """
+    query = select(
+        func.count().label("total"),
+        func.count().filter(User.level == "bronze").label("bronze"),
+        func.count().filter(User.level == "silver").label("silver"),
+        func.count().filter(User.level == "gold").label("gold"),
+        func.count().filter(User.bot_accessible == False).label("blocked"),
+    )
+    row = (await db.execute(query)).one()
+    return dict(row._mapping)
+
+async def find_users_async(db: AsyncSession, query: str, limit: int = 10) -> list[User]:
+    """Ищет пользователей по ID, telegram_id, username или ФИО."""
+    search_query = f"%{query.lstrip('@')}%"
+
+    filter_conditions = [
+        User.username.ilike(search_query),
+        USER_FULL_NAME.ilike(search_query),
+    ]
+
+    if query.isdigit():
+        filter_conditions.append(User.id == int(query))
+        filter_conditions.append(User.telegram_id == int(query))
+
+    result = await db.execute(select(User).where(or_(*filter_conditions)).limit(limit))
+    return list(result.scalars().all())
+
+async def list_users_paginated_async(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 20,
+    level: str | None = None,
+    bot_blocked: bool | None = None
+) -> tuple[list[User], int]:
+    """
+    Возвращает страницу пользователей и общее количество по фильтрам за один запрос
+    (COUNT(*) OVER () считается до применения LIMIT/OFFSET).
+    """
+    total_column = func.count().over().label("total")
+    query = _apply_user_filters(select(User, total_column), level, bot_blocked)
+    rows = (await db.execute(query.order_by(User.id.desc()).offset(skip).limit(limit))).all()
+    if rows:
+        return [row[0] for row in rows], rows[0].total
+    # Пустая страница (например, за пределами списка) - total из окна не получить
+    if skip > 0:
+        return [], await count_users_with_filters_async(db, level, bot_blocked)
+    return [], 0
+
+async def count_users_with_filters_async(
+    db: AsyncSession,
+    level: str | None = None,
+    bot_blocked: bool | None = None
+) -> int:
+    """Подсчитывает общее количество пользователей с учетом фильтров."""
+    query = _apply_user_filters(select(func.count(User.id)), level, bot_blocked)
+    return await db.scalar(query)
+
+async def activate_user_from_telegram_async(
+    db: AsyncSession,
+    telegram_id: int,
+    username: str | None,
+    first_name: str | None,
+    last_name: str | None
+) -> tuple[int, bool] | None:
+    """
+    Одним UPDATE ... RETURNING обновляет профиль из Telegram и помечает бота доступным.
+    Строка переписывается только если что-то действительно изменилось (IS DISTINCT FROM).
+    Возвращает (ID пользователя, были ли изменения) или None, если такого пользователя еще нет.
+    """
+    query = (
+        update(User)
+        .where(
+            User.telegram_id == telegram_id,
+            or_(
+                User.username.is_distinct_from(username),
+                User.first_name.is_distinct_from(first_name),
+                User.last_name.is_distinct_from(last_name),
+                User.bot_accessible.is_distinct_from(True),
+            )
+        )
+        .values(username=username, first_name=first_name, last_name=last_name, bot_accessible=True)
+        .returning(User.id)
+    )
+    user_id = await db.scalar(query)
+    if user_id is not None:
+        return user_id, True
+
+    # Ничего не изменилось - или пользователя нет вовсе
+    user_id = await db.scalar(select(User.id).where(User.telegram_id == telegram_id))
+    return (user_id, False) if user_id is not None else None
+
+async def update_user_phone_by_telegram_id_async(db: AsyncSession, telegram_id: int, phone: str):
+    """
+    Сохраняет телефон пользователя одним UPDATE ... RETURNING, без загрузки всей строки.
+    Возвращает (id, wordpress_id) или None, если пользователя нет.
+    """
+    query = (
+        update(User)
+        .where(User.telegram_id == telegram_id)
+        .values(phone=phone)
+        .returning(User.id, User.wordpress_id)
+    )
+    return (await db.execute(query)).one_or_none()
+
+async def get_user_name_source_async(db: AsyncSession, telegram_id: int):
+    """Возвращает только (wordpress_id, username) пользователя - для подписи в диалогах админа."""
+    query = select(User.wordpress_id, User.username).where(User.telegram_id == telegram_id)
+    return (await db.execute(query)).one_or_none()
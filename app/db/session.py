@@ -1,10 +1,46 @@
+from uuid import uuid4
+
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
 from app.core.config import settings
 
-engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
+# Общие параметры пула: соединения переиспользуются между запросами и колбэками,
+# вместо TCP + авторизации в Postgres на каждый клик. NullPool остается только у Alembic.
+POOL_OPTIONS = {
+    "pool_timeout": settings.DATABASE_POOL_TIMEOUT,
+    "pool_recycle": settings.DATABASE_POOL_RECYCLE,
+    "pool_pre_ping": True,
+    # LIFO: в работе держится небольшой "горячий" набор соединений,
+    # лишние простаивают и закрываются по pool_recycle
+    "pool_use_lifo": True,
+}
+
+engine = create_engine(
+    settings.DATABASE_URL,
+    pool_size=settings.DATABASE_POOL_SIZE,
+    max_overflow=settings.DATABASE_MAX_OVERFLOW,
+    **POOL_OPTIONS
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
\ No newline at end of file
+# Асинхронный движок для хендлеров бота: ожидание БД не блокирует event loop
+# За pgbouncer (transaction mode) кеш prepared statements asyncpg отключаем,
+# а имена делаем уникальными - иначе они конфликтуют между серверными соединениями.
+ASYNC_CONNECT_ARGS = {
+    "statement_cache_size": 0,
+    "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+} if settings.DATABASE_USES_POOLER else {}
+# Свой, меньший пул: через async-движок ходят только хендлеры бота
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL,
+    connect_args=ASYNC_CONNECT_ARGS,
+    pool_size=settings.DATABASE_ASYNC_POOL_SIZE,
+    max_overflow=settings.DATABASE_ASYNC_MAX_OVERFLOW,
+    **POOL_OPTIONS
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+Base = declarative_base()
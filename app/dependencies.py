@@ -1,16 +1,17 @@
 # app/dependencies.py
 
 import logging
-from typing import Optional, Iterator
-from contextlib import contextmanager
+from typing import Optional, Iterator, AsyncIterator
+from contextlib import asynccontextmanager
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
 
 from app.core.config import settings
-from app.db.session import SessionLocal
+from app.db.session import SessionLocal, AsyncSessionLocal
 from app.models.user import User
 
 # --- Инициализация логгера ---
@@ -36,16 +37,14 @@ def get_db() -> Iterator[Session]:
     finally:
         db.close()
 
-@contextmanager
-def get_db_context() -> Iterator[Session]:
+@asynccontextmanager
+async def get_db_context() -> AsyncIterator[AsyncSession]:
     """
-    Контекстный менеджер для получения сессии БД вне FastAPI (для бота и фоновых задач).
+    Асинхронный контекстный менеджер для получения сессии БД вне FastAPI (для бота).
+    Сессия закрывается автоматически при выходе из блока `async with`.
     """
-    db = get_db_session_instance()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 # --- Зависимости аутентификации и авторизации ---
 
@@ -1,6 +1,7 @@
 # app/main.py
 
 import asyncio
+import contextlib
 import os
 import traceback
 import logging
@@ -13,7 +14,9 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 # Конфигурация и ядро
 from app.core.config import settings as config
 from app.core.logging_config import setup_logging
-from app.core.redis import redis_client
+from app.core.redis import redis_client, run_cache_invalidation_listener
+from app.db.session import engine, async_engine
+from app.clients.woocommerce import wc_client
 
 # Роутеры FastAPI
 from app.routers.v1.api import api_router as api_v1_router
@@ -32,6 +35,7 @@ from app.services.customer_engagement import activate_new_users_task, reactivate
 from app.services.bot_status_updater import check_inactive_bots_task
 from app.services.notification_cleanup import cleanup_old_notifications_task
 from app.bot.services import notification as bot_notification_service
+from app.bot.services import broadcast as broadcast_service
 from app.services.birthday_greeter import check_birthdays_task
 
 # --- Инициализация ---
@@ -105,8 +109,21 @@ async def lifespan(app: FastAPI):
     else:
         logger.info("This is a secondary worker. Skipping initial setup.")
 
+    # Рассылки выполняет один процесс - владелец блокировки воркера в Redis
+    # (лимит скорости отправок действует в пределах процесса). Остальные воркеры
+    # ждут и подхватят очередь, если владелец остановится.
+    broadcast_worker_task = asyncio.create_task(broadcast_service.run_broadcast_worker_supervisor())
+    # Каждый воркер слушает инвалидацию кеша, чтобы сбрасывать локальные копии
+    cache_listener_task = asyncio.create_task(run_cache_invalidation_listener())
+
     yield
     
+    # Дожидаемся остановки воркера рассылок, чтобы он успел освободить блокировку
+    broadcast_worker_task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await broadcast_worker_task
+    cache_listener_task.cancel()
+    
     # Код при остановке
     if is_main_worker:
         logger.info("Main worker shutting down...")
@@ -121,6 +138,11 @@ async def lifespan(app: FastAPI):
     else:
         logger.info("Secondary worker shutting down.")
 
+    # Закрываем пулы соединений с БД и WooCommerce этого воркера
+    await async_engine.dispose()
+    engine.dispose()
+    await wc_client.close()
+
 # --- Создание FastAPI приложения ---
 app = FastAPI(
     title="Telegram Mini App Service",
@@ -1,12 +1,19 @@
 # app/models/user.py
 
-from sqlalchemy import Column, Date, Integer, String, Boolean, BIGINT, DateTime, func
+from sqlalchemy import Column, Date, Index, Integer, String, Boolean, BIGINT, DateTime, func, text
 from sqlalchemy.orm import relationship
 from .referral import Referral
 from app.db.session import Base
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Триграммные индексы для поиска по подстроке (ILIKE) в find_users.
+        # Объявлены здесь, чтобы autogenerate не предлагал их удалить (создает их миграция 7e1c0b98f668).
+        Index("ix_users_username_trgm", "username", postgresql_using="gin", postgresql_ops={"username": "gin_trgm_ops"}),
+        # Выражение должно совпадать с (User.first_name + ' ' + User.last_name) в find_users
+        Index("ix_users_full_name_trgm", text("(first_name || ' ' || last_name) gin_trgm_ops"), postgresql_using="gin"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     telegram_id = Column(BIGINT, unique=True, index=True, nullable=False)
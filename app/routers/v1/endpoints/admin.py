@@ -3,7 +3,7 @@
 from fastapi import APIRouter, Depends, Query, HTTPException, status, BackgroundTasks, Response
 from sqlalchemy.orm import Session
 from typing import Any, List
-from app.core.redis import redis_client
+from app.core.redis import redis_client, invalidate_many, CACHE_INVALIDATION_CHANNEL
 from typing import Literal
 from app.dependencies import get_db, get_admin_user
 from app.models.user import User
@@ -15,10 +15,12 @@ from app.crud import notification as crud_notification
 from app.schemas.product import PaginatedOrders, PaginatedResponse
 from app.schemas.settings import ShopSettings
 from app.services import admin as admin_service
+from app.services import settings as settings_service
 from app.crud import user as crud_user
 from app.crud import loyalty as crud_loyalty
 from app.services import loyalty as loyalty_service
 from app.bot.services import notification as bot_notification_service
+from app.bot.services import admin_panel as admin_panel_service
 from app.models.broadcast import Broadcast
 from app.bot.services.broadcast import process_broadcast
 
@@ -75,24 +77,28 @@ async def get_user_details_endpoint(
 
 
 @router.post("/users/{user_id}/block", status_code=status.HTTP_204_NO_CONTENT)
-def block_user_endpoint(user_id: int, db: Session = Depends(get_db)):
+async def block_user_endpoint(user_id: int, db: Session = Depends(get_db)):
     """[АДМИН] Блокирует пользователя."""
     user = crud_user.get_user_by_id(db, user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     user.is_blocked = True
     db.commit()
+    # Карточка в боте показывает статус и кнопку блокировки - сбрасываем кеш
+    await admin_panel_service.invalidate_user_card(user.id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
 @router.post("/users/{user_id}/unblock", status_code=status.HTTP_204_NO_CONTENT)
-def unblock_user_endpoint(user_id: int, db: Session = Depends(get_db)):
+async def unblock_user_endpoint(user_id: int, db: Session = Depends(get_db)):
     """[АДМИН] Разблокирует пользователя."""
     user = crud_user.get_user_by_id(db, user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     user.is_blocked = False
     db.commit()
+    # Карточка в боте показывает статус и кнопку блокировки - сбрасываем кеш
+    await admin_panel_service.invalidate_user_card(user.id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
@@ -221,11 +227,14 @@ async def clear_cache_endpoint(
     """
     if target == "all":
         await redis_client.flushall()
+        await redis_client.publish(CACHE_INVALIDATION_CHANNEL, settings_service.SHOP_SETTINGS_CACHE_KEY)
         return {"status": "ok", "message": "All Redis cache has been cleared."}
     
     keys_to_delete = []
     if target == "settings":
-        keys_to_delete = await redis_client.keys("shop_settings")
+        # Через invalidate_many, чтобы воркеры сбросили и локальную копию настроек
+        await invalidate_many([settings_service.SHOP_SETTINGS_CACHE_KEY])
+        return {"status": "ok", "message": "Shop settings cache has been cleared."}
     elif target == "catalog":
         keys_to_delete.extend(await redis_client.keys("product:*"))
         keys_to_delete.extend(await redis_client.keys("products:*"))
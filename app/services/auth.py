@@ -10,7 +10,9 @@ import httpx
 from fastapi import Depends, HTTPException, status
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.bot.services import notification as bot_notification_service
+from app.bot.services import admin_panel as admin_panel_service
 
 # Импорты сгруппированы для читаемости
 from app.clients.woocommerce import wc_client
@@ -24,6 +26,7 @@ from app.crud import (
 )
 from app.db.session import SessionLocal
 from app.models.loyalty import LoyaltyTransaction
+from app.models.notification import Notification
 from app.models.user import User
 from app.schemas.user import Token
 from app.services import settings as settings_service
@@ -50,6 +53,61 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
 
+async def _create_wc_customer(telegram_id: int, first_name: str, last_name: str) -> int:
+    """
+    Создает клиента в WooCommerce (или находит уже существующего) и возвращает его ID.
+    """
+    try:
+        # --- ИЗМЕНЕНИЕ ЗДЕСЬ: ГЕНЕРИРУЕМ И ДОБАВЛЯЕМ ПАРОЛЬ ---
+        password = secrets.token_urlsafe(16) # Генерируем 16-символьный пароль
+        new_wc_user_data = {
+            "email": f"{telegram_id}@telegram.user",
+            "username": str(telegram_id),
+            "first_name": first_name,
+            "last_name": last_name,
+            "password": password # <-- Добавляем пароль в payload
+        }
+        # ----------------------------------------------------
+        
+        created_wc_user = await wc_client.post("wc/v3/customers", json=new_wc_user_data)
+        return created_wc_user["id"]
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 400 and e.response.json().get("code") == "registration-error-email-exists":
+            logger.warning("User already exists in WooCommerce. Attempting to sync.")
+            existing_wc_user_response = await wc_client.get("wc/v3/customers", params={"email": f"{telegram_id}@telegram.user"})
+            existing_wc_users = existing_wc_user_response.json()
+            if existing_wc_users:
+                return existing_wc_users[0]["id"]
+            # Этого никогда не должно произойти, но лучше обработать
+            raise HTTPException(status_code=500, detail="User sync failed: WC user exists but could not be retrieved.")
+        logger.error(f"Failed to create user in WooCommerce: {e.response.text}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Could not create user in WordPress.")
+
+
+def _choose_welcome_bonus(shop_settings, has_referral: bool, user_id: int) -> tuple[int, str | None, str, str]:
+    """
+    Выбирает приветственный бонус нового пользователя: реферальный или общий.
+    Возвращает (баллы, тип транзакции, заголовок, текст уведомления); баллы = 0 - бонуса нет.
+    """
+    if has_referral and shop_settings.referral_welcome_bonus > 0:
+        bonus_amount = shop_settings.referral_welcome_bonus
+        logger.info(f"Granting REFERRAL welcome bonus ({bonus_amount}) to user {user_id}")
+        return (
+            bonus_amount, "promo_referral_welcome", "Приветственный бонус!",
+            f"Вы получили {bonus_amount} баллов за регистрацию по приглашению. Добро пожаловать!"
+        )
+
+    if shop_settings.is_welcome_bonus_active and shop_settings.welcome_bonus_amount > 0:
+        bonus_amount = shop_settings.welcome_bonus_amount
+        logger.info(f"Granting GENERAL welcome bonus ({bonus_amount}) to user {user_id}")
+        return (
+            bonus_amount, "promo_welcome", "Добро пожаловать!",
+            f"Вам начислен приветственный бонус: {bonus_amount} баллов!"
+        )
+
+    return 0, None, "", ""
+
+
 async def register_or_get_user(
     db: Session,
     user_info: Dict[str, Any],
@@ -71,34 +129,7 @@ async def register_or_get_user(
         
         first_name = user_info.get("first_name", "")
         last_name = user_info.get("last_name", "")
-            
-        try:
-            # --- ИЗМЕНЕНИЕ ЗДЕСЬ: ГЕНЕРИРУЕМ И ДОБАВЛЯЕМ ПАРОЛЬ ---
-            password = secrets.token_urlsafe(16) # Генерируем 16-символьный пароль
-            new_wc_user_data = {
-                "email": f"{telegram_id}@telegram.user",
-                "username": str(telegram_id),
-                "first_name": first_name,
-                "last_name": last_name,
-                "password": password # <-- Добавляем пароль в payload
-            }
-            # ----------------------------------------------------
-            
-            created_wc_user = await wc_client.post("wc/v3/customers", json=new_wc_user_data)
-            wordpress_id = created_wc_user["id"]
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 400 and e.response.json().get("code") == "registration-error-email-exists":
-                logger.warning("User already exists in WooCommerce. Attempting to sync.")
-                existing_wc_user_response = await wc_client.get("wc/v3/customers", params={"email": f"{telegram_id}@telegram.user"})
-                existing_wc_users = existing_wc_user_response.json()
-                if existing_wc_users:
-                    wordpress_id = existing_wc_users[0]["id"]
-                else:
-                    # Этого никогда не должно произойти, но лучше обработать
-                    raise HTTPException(status_code=500, detail="User sync failed: WC user exists but could not be retrieved.")
-            else:
-                logger.error(f"Failed to create user in WooCommerce: {e.response.text}", exc_info=True)
-                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Could not create user in WordPress.")
+        wordpress_id = await _create_wc_customer(telegram_id, first_name, last_name)
             
         new_referral_code = secrets.token_urlsafe(8)
         while crud_user.get_user_by_referral_code(db, code=new_referral_code):
@@ -116,29 +147,15 @@ async def register_or_get_user(
                 crud_referral.create_referral(db, referrer_id=referrer.id, referred_id=db_user.id)
                 logger.info(f"Referral link created: referrer_id={referrer.id} -> referred_id={db_user.id}")
 
+        await admin_panel_service.invalidate_user_stats()
+
     if is_new_user:
         try:
             shop_settings = await settings_service.get_shop_settings(redis_client)
             referral_link = crud_referral.get_referral_by_referred_id(db, referred_id=db_user.id)
-            
-            bonus_amount = 0
-            bonus_type = None
-            bonus_title = ""
-            bonus_message = ""
-            
-            if referral_link and shop_settings.referral_welcome_bonus > 0:
-                bonus_amount = shop_settings.referral_welcome_bonus
-                bonus_type = "promo_referral_welcome"
-                bonus_title = "Приветственный бонус!"
-                bonus_message = f"Вы получили {bonus_amount} баллов за регистрацию по приглашению. Добро пожаловать!"
-                logger.info(f"Granting REFERRAL welcome bonus ({bonus_amount}) to user {db_user.id}")
-            
-            elif shop_settings.is_welcome_bonus_active and shop_settings.welcome_bonus_amount > 0:
-                bonus_amount = shop_settings.welcome_bonus_amount
-                bonus_type = "promo_welcome"
-                bonus_title = "Добро пожаловать!"
-                bonus_message = f"Вам начислен приветственный бонус: {bonus_amount} баллов!"
-                logger.info(f"Granting GENERAL welcome bonus ({bonus_amount}) to user {db_user.id}")
+            bonus_amount, bonus_type, bonus_title, bonus_message = _choose_welcome_bonus(
+                shop_settings, bool(referral_link), db_user.id
+            )
             
             if bonus_amount > 0 and bonus_type:
                 crud_loyalty.create_transaction(db, user_id=db_user.id, points=bonus_amount, type=bonus_type)
@@ -150,6 +167,66 @@ async def register_or_get_user(
     return db_user
 
 
+async def register_or_get_user_async(
+    db: AsyncSession,
+    user_info: Dict[str, Any],
+    referral_code: str | None = None
+) -> User:
+    """
+    То же, что register_or_get_user, но через AsyncSession - для хендлеров бота:
+    запросы к БД не блокируют цикл событий aiogram.
+    """
+    telegram_id = user_info.get("id")
+    if not telegram_id:
+        raise ValueError("Telegram ID is missing in user_info")
+
+    db_user = await crud_user.get_user_by_telegram_id_async(db, telegram_id=telegram_id)
+    if db_user:
+        return db_user
+
+    logger.info(f"User with telegram_id {telegram_id} not found in local DB. Creating new user.")
+    first_name = user_info.get("first_name", "")
+    last_name = user_info.get("last_name", "")
+    wordpress_id = await _create_wc_customer(telegram_id, first_name, last_name)
+
+    new_referral_code = secrets.token_urlsafe(8)
+    while await crud_user.get_user_by_referral_code_async(db, code=new_referral_code):
+        new_referral_code = secrets.token_urlsafe(8)
+
+    db_user = await crud_user.create_user_async(
+        db, telegram_id=telegram_id, wordpress_id=wordpress_id,
+        username=user_info.get("username"), referral_code=new_referral_code,
+        first_name=first_name, last_name=last_name
+    )
+
+    has_referral = False
+    if referral_code:
+        referrer = await crud_user.get_user_by_referral_code_async(db, code=referral_code)
+        if referrer and referrer.id != db_user.id:
+            await crud_referral.create_referral_async(db, referrer_id=referrer.id, referred_id=db_user.id)
+            has_referral = True
+            logger.info(f"Referral link created: referrer_id={referrer.id} -> referred_id={db_user.id}")
+
+    await admin_panel_service.invalidate_user_stats()
+
+    try:
+        shop_settings = await settings_service.get_shop_settings(redis_client)
+        bonus_amount, bonus_type, bonus_title, bonus_message = _choose_welcome_bonus(
+            shop_settings, has_referral, db_user.id
+        )
+
+        if bonus_amount > 0 and bonus_type:
+            # Транзакция и уведомление о бонусе сохраняются одним коммитом
+            db.add(LoyaltyTransaction(user_id=db_user.id, points=bonus_amount, type=bonus_type))
+            db.add(Notification(user_id=db_user.id, type="points_earned", title=bonus_title, message=bonus_message))
+            await db.commit()
+            await bot_notification_service.send_welcome_bonus(db, db_user, bonus_amount)
+    except Exception as e:
+        logger.error(f"Failed during bonus granting for new user {db_user.id}", exc_info=True)
+
+    return db_user
+
+
 async def authenticate_telegram_user(init_data: str, db: Session = Depends(get_db)) -> Token:
     """
     Функция для эндпоинта /auth/telegram.
@@ -170,7 +247,8 @@ async def authenticate_telegram_user(init_data: str, db: Session = Depends(get_d
     # --- ИСПРАВЛЕНИЕ: Передаем сессию `db` ---
     db_user = await register_or_get_user(db, user_info=user_info, referral_code=referral_code)
     
-    user_service.update_user_profile_from_telegram(db, db_user, user_info)
+    if user_service.update_user_profile_from_telegram(db, db_user, user_info):
+        await admin_panel_service.invalidate_user_card(db_user.id)
     
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -1,5 +1,6 @@
 # app/services/bot_status_updater.py
 import logging
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 from app.db.session import SessionLocal
 from app.models.user import User
@@ -16,8 +17,8 @@ async def check_inactive_bots_task():
     
     with SessionLocal() as db:
         try:
-            # Находим всех, у кого бот помечен как недоступный
-            users_to_check = db.query(User).filter(User.bot_accessible == False).all()
+            # Находим всех, у кого бот помечен как недоступный (только нужные колонки)
+            users_to_check = db.query(User.id, User.telegram_id, User.bot_accessible).filter(User.bot_accessible == False).all()
             
             if not users_to_check:
                 logger.info("No inactive bots to check.")
@@ -25,9 +26,16 @@ async def check_inactive_bots_task():
 
             logger.info(f"Found {len(users_to_check)} users with inactive bots to ping.")
             
+            # Пингуем каждого, а снова доступных помечаем одним UPDATE в конце
+            reachable_user_ids = []
             for user in users_to_check:
-                # Пингуем каждого. Функция ping_user сама обновит статус в БД, если нужно.
-                await ping_user(db, user)
+                if await ping_user(db, user, update_status=False):
+                    reachable_user_ids.append(user.id)
+
+            if reachable_user_ids:
+                db.execute(update(User).where(User.id.in_(reachable_user_ids)).values(bot_accessible=True))
+                db.commit()
+            logger.info(f"{len(reachable_user_ids)} users have unblocked the bot.")
         
         except Exception as e:
             logger.error("An error occurred during inactive bots check task", exc_info=True)
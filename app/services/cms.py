@@ -234,7 +234,8 @@ async def process_new_promo(promo_id: int):
 
             logger.info(f"Promo {promo_id}: Found {len(users)} target users.")
 
-            # 4. Создаем уведомления и отправляем сообщения
+            # 4. Создаем уведомления в Mini App, а сообщения в бот отправляем потом параллельно
+            recipients = []
             for user in users:
                 # Проверка на дубликаты
                 existing_notification = crud_notification.get_notification_by_type_and_entity(
@@ -254,15 +255,15 @@ async def process_new_promo(promo_id: int):
                     action_url=action_url,
                     image_url=media_url
                 )
-                
-                # Отправляем сообщение в бот
-                await bot_notification_service.send_promo_notification(
-                    db=db, user=user, title=title, text=message_text,
-                    image_url=media_url, action_url=action_url
-                )
-                await asyncio.sleep(0.1)
+                recipients.append(user)
+
+            # Отправляем сообщения в бот (скорость ограничивает общий лимитер отправок)
+            sent_count, failed_users = await bot_notification_service.send_promo_to_users(
+                db=db, users=recipients, title=title, text=message_text,
+                image_url=media_url, action_url=action_url
+            )
             
-            logger.info(f"Promo {promo_id}: Processing completed for {len(users)} users.")
+            logger.info(f"Promo {promo_id}: Processing completed for {len(users)} users. Sent: {sent_count}, failed: {len(failed_users)}.")
 
         except Exception as e:
             logger.error(f"Failed to process promo {promo_id}", exc_info=True)
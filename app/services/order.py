@@ -153,8 +153,7 @@ async def create_order_from_cart(
     # 5. Валидация ответа и отправка уведомлений
     validated_order = Order.model_validate(created_order_data)
     
-    await notification_service.send_new_order_confirmation(db, current_user, validated_order)
-    await notification_service.send_new_order_to_admin(validated_order, current_user)
+    await notification_service.notify_new_order(db, current_user, validated_order)
 
     return validated_order
 
@@ -34,18 +34,15 @@ async def notify_about_expiring_points_task():
 
                 logger.info(f"Found {len(expiring_soon_list)} users with points expiring in {days} days.")
 
-                for user_id, total_points in expiring_soon_list:
-                    user = db.query(User).filter(User.id == user_id).first()
-                    if user:
-                        try:
-                            await notification_service.send_points_expiring_soon_notification(
-                                db=db,
-                                user=user,
-                                points_expiring=int(total_points),
-                                days_left=days
-                            )
-                        except Exception as e:
-                            logger.error(f"Failed to send expiring points notification to user {user.id}", exc_info=True)
+                # Пользователей загружаем одним запросом, а уведомления отправляем параллельно
+                points_by_user_id = {user_id: int(total_points) for user_id, total_points in expiring_soon_list}
+                users = db.query(User).filter(User.id.in_(points_by_user_id)).all()
+                messages = [
+                    (user, notification_service.format_points_expiring_soon_message(points_by_user_id[user.id], days))
+                    for user in users
+                ]
+                sent_count, failed_users = await notification_service.send_many(db, messages)
+                logger.info(f"Expiring points notifications ({days} days): sent {sent_count}, failed {len(failed_users)}.")
 
         except Exception as e:
             logger.error("An error occurred during expiring points notification task", exc_info=True)
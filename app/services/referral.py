@@ -10,6 +10,10 @@ from app.core.config import settings
 import logging
 
 logger = logging.getLogger(__name__)
+
+# Префикс реферальной ссылки зависит только от настроек - собираем его один раз
+REFERRAL_LINK_PREFIX = f"https://t.me/{settings.TELEGRAM_BOT_USERNAME.lstrip('@')}?start=ref_"
+
 def get_user_referral_info(db: Session, user: User) -> ReferralInfo:
     """Собирает полную статистику по реферальной программе для пользователя."""
     
@@ -33,8 +37,7 @@ def get_user_referral_info(db: Session, user: User) -> ReferralInfo:
     # 3. Формируем ссылку, только если код точно есть
     referral_link = ""
     if user.referral_code:
-        bot_username = getattr(settings, "TELEGRAM_BOT_USERNAME", "your_bot")
-        referral_link = f"https://t.me/{bot_username}?start=ref_{user.referral_code}"
+        referral_link = f"{REFERRAL_LINK_PREFIX}{user.referral_code}"
     
     # -----------------------------------------------
     
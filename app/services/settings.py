@@ -2,11 +2,13 @@
 
 import json
 import logging
+import time
 from redis.asyncio import Redis
 
 from app.clients.woocommerce import wc_client
 from app.schemas.settings import ShopSettings
 from app.core.config import settings as app_settings # Используем псевдоним, чтобы избежать конфликтов
+from app.core.redis import on_cache_invalidated
 
 logger = logging.getLogger(__name__)
 
@@ -14,19 +16,42 @@ logger = logging.getLogger(__name__)
 # Важно: этот ID должен соответствовать ID страницы, созданной в вашей админке.
 SHOP_SETTINGS_PAGE_ID = app_settings.SHOP_SETTINGS_PAGE_ID # Предполагаем, что вынесли в .env / config.py
 CACHE_TTL_SECONDS = 3600  # Кешируем настройки на 1 час
+SHOP_SETTINGS_CACHE_KEY = "shop_settings"
+# Копия настроек в памяти процесса. Сбрасывается по pub/sub при изменении настроек,
+# короткий TTL - страховка на случай пропущенного сообщения.
+LOCAL_CACHE_TTL_SECONDS = 60
+_local_settings: ShopSettings | None = None
+_local_settings_expires_at = 0.0
+
+def clear_local_shop_settings():
+    """Сбрасывает копию настроек в памяти процесса."""
+    global _local_settings
+    _local_settings = None
+
+on_cache_invalidated(SHOP_SETTINGS_CACHE_KEY, clear_local_shop_settings)
+
+def _remember_locally(settings_data: ShopSettings) -> ShopSettings:
+    global _local_settings, _local_settings_expires_at
+    _local_settings = settings_data
+    _local_settings_expires_at = time.monotonic() + LOCAL_CACHE_TTL_SECONDS
+    return settings_data
 
 async def get_shop_settings(redis: Redis) -> ShopSettings:
     """
     Получает глобальные настройки магазина из WordPress через REST API,
     используя кеширование в Redis.
     """
-    cache_key = "shop_settings"
+    cache_key = SHOP_SETTINGS_CACHE_KEY
+
+    # 0. Копия в памяти процесса - без похода в Redis
+    if _local_settings is not None and time.monotonic() < _local_settings_expires_at:
+        return _local_settings
     
     # 1. Пытаемся получить настройки из кеша
     cached_settings = await redis.get(cache_key)
     if cached_settings:
         try:
-            return ShopSettings.model_validate(json.loads(cached_settings))
+            return _remember_locally(ShopSettings.model_validate(json.loads(cached_settings)))
         except Exception as e:
             logger.warning(f"Failed to validate cached shop settings: {e}. Fetching fresh settings.")
             
@@ -58,7 +83,7 @@ async def get_shop_settings(redis: Redis) -> ShopSettings:
         # 5. Сохраняем валидные данные в кеш
         await redis.set(cache_key, settings_data.model_dump_json(), ex=CACHE_TTL_SECONDS)
         
-        return settings_data
+        return _remember_locally(settings_data)
 
     except Exception as e:
         logger.error("CRITICAL: Failed to fetch or parse shop settings from WordPress.", exc_info=True)
@@ -217,6 +217,7 @@ async def get_user_dashboard(db: Session, current_user: User) -> UserDashboard:
 def update_user_profile_from_telegram(db: Session, user: User, telegram_user_data: dict):
     """
     Обновляет данные в нашей локальной БД на основе свежих данных от Telegram.
+    Возвращает True, если что-то изменилось.
     """
     updated = False
     
@@ -240,4 +241,5 @@ def update_user_profile_from_telegram(db: Session, user: User, telegram_user_dat
     if updated:
         db.commit()
         db.refresh(user)
-        logger.info(f"Updated local profile for user {user.id} from Telegram data.")
\ No newline at end of file
+        logger.info(f"Updated local profile for user {user.id} from Telegram data.")
+    return updated
\ No newline at end of file
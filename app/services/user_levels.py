@@ -1,10 +1,10 @@
 # app/services/user_levels.py
-from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 
 from app.db.session import SessionLocal
 from app.models.user import User
 from app.clients.woocommerce import wc_client
+from app.bot.services import admin_panel as admin_panel_service
 import logging
 
 logger = logging.getLogger(__name__)
@@ -80,9 +80,9 @@ async def update_all_user_levels():
     Проходит по всем пользователям и обновляет их уровни лояльности.
     """
     logger.info("--- Starting scheduled job: Update User Levels ---")
-    db: Session = SessionLocal()
-    try:
+    with SessionLocal() as db:
         all_users = db.query(User).all()
+        changed_user_ids = []
         
         for user in all_users:
             total_spent = await get_total_spending_for_user(user.wordpress_id)
@@ -91,8 +91,11 @@ async def update_all_user_levels():
             if user.level != new_level:
                 logger.info(f"Updating user {user.id} level from '{user.level}' to '{new_level}' (spent: {total_spent})")
                 user.level = new_level
+                changed_user_ids.append(user.id)
         
         db.commit()
-    finally:
-        db.close()
+        if changed_user_ids:
+            await admin_panel_service.invalidate_user_stats()
+            # Уровень показывается в карточке пользователя
+            await admin_panel_service.invalidate_user_cards(changed_user_ids)
     logger.info("--- Finished scheduled job: Update User Levels ---")
\ No newline at end of file
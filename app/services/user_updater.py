@@ -5,6 +5,7 @@ from app.db.session import SessionLocal
 from app.models.user import User
 from app.bot.core import bot
 from app.services.user import update_user_profile_from_telegram
+from app.bot.services import admin_panel as admin_panel_service
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +14,7 @@ async def update_all_usernames_task():
     with SessionLocal() as db:
         users_to_update = db.query(User).all()
         updated_count = 0
+        changed_user_ids = []
         
         for user in users_to_update:
             try:
@@ -22,7 +24,8 @@ async def update_all_usernames_task():
                 telegram_user_data = chat_info.model_dump()
                 
                 # Используем нашу уже готовую функцию
-                update_user_profile_from_telegram(db, user, telegram_user_data)
+                if update_user_profile_from_telegram(db, user, telegram_user_data):
+                    changed_user_ids.append(user.id)
                 updated_count += 1
                 
                 # Пауза, чтобы не превысить лимиты API (не более 30 запросов в сек)
@@ -30,4 +33,6 @@ async def update_all_usernames_task():
             except Exception as e:
                 logger.warning(f"Could not update username for user {user.id}: {e}")
                 
+    # Username показывается в карточке пользователя в боте
+    await admin_panel_service.invalidate_user_cards(changed_user_ids)
     logger.info(f"--- Finished username update. Processed {updated_count} users. ---")
\ No newline at end of file
@@ -17,6 +17,10 @@ from app.core.config import settings
 from app.bot.handlers.user import user_router
 from app.bot.handlers.admin_dialogs import admin_dialog_router
 from app.bot.handlers.admin_actions import admin_actions_router
+from app.bot.services import broadcast as broadcast_service
+from app.bot.core import create_bot_session
+from app.core.redis import run_cache_invalidation_listener
+from app.clients.woocommerce import wc_client
 
 import logging
 
@@ -29,7 +33,7 @@ async def main() -> None:
     # 1. Инициализация бота и диспетчера
     # (Дублируем код из app/bot/core.py, так как он нам нужен здесь)
     default_properties = DefaultBotProperties(parse_mode=ParseMode.HTML)
-    bot = Bot(token=settings.TELEGRAM_BOT_TOKEN, default=default_properties)
+    bot = Bot(token=settings.TELEGRAM_BOT_TOKEN, default=default_properties, session=create_bot_session())
     dp = Dispatcher()
 
     # 2. Подключаем все наши роутеры в правильном порядке
@@ -46,9 +50,18 @@ async def main() -> None:
     await bot.delete_webhook(drop_pending_updates=True)
     logger.info("Webhook deleted.")
 
-    # 4. Запускаем поллинг
+    # 4. Запускаем воркер очереди рассылок (работает, пока процесс владеет блокировкой в Redis)
+    broadcast_worker_task = asyncio.create_task(broadcast_service.run_broadcast_worker_supervisor())
+    cache_listener_task = asyncio.create_task(run_cache_invalidation_listener())
+
+    # 5. Запускаем поллинг
     logger.info("Starting polling...")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        broadcast_worker_task.cancel()
+        cache_listener_task.cancel()
+        await wc_client.close()
 
 
 if __name__ == "__main__":